@@ -1,11 +1,14 @@
 import requests
 import json
-import pandas as pd
 import time
 import re
-from sqlalchemy import create_engine, text, exc
+import sys
 from datetime import datetime, date
 from urllib.parse import urlencode
+from http_cache import ResponseCache
+from http_transport import create_session
+from response_archive import ResponseArchive
+import run_metrics
 
 # 数据库配置
 DB_CONFIG = {
@@ -18,80 +21,112 @@ DB_CONFIG = {
     'collation': 'utf8mb4_unicode_ci'
 }
 
+# 数据库后端：'mysql' / 'sqlite'（不需要数据库服务，见storage.py；文件与QStop.py共用）
+DB_BACKEND = 'mysql'
+SQLITE_PATH = 'data/qs.sqlite'
+
+# 本地响应缓存（与QStop.py共用），QS排名每年更新一次，缓存30天
+HTTP_CACHE = True
+HTTP_CACHE_PATH = 'cache/qs_http_cache.sqlite'
+HTTP_CACHE_TTL = 30 * 24 * 3600
+
+# 原始响应归档到archive/，可用reparse.py离线重新解析
+ARCHIVE_RESPONSES = True
+
+# 导出文件格式：'xlsx' / 'csv' / 'parquet'（parquet需要pyarrow）
+EXPORT_FORMAT = 'xlsx'
+
+# 写库方式：'swap' 装载到暂存表后 EXCHANGE PARTITION 原子换入 / 'upsert' 直接分批upsert到正式表
+DB_LOAD_MODE = 'swap'
+RANK_COLUMNS = ['university_id', 'crawl_date', 'rank', 'overall_score']
+RANK_UPDATE_COLUMNS = ['rank', 'overall_score']
+# university_rank 的二级索引 {索引名: 列}：建表和swap模式下暂存表装载后建索引共用这一份定义
+RANK_INDEXES = {'idx_crawl_date_rank': ['crawl_date', 'rank']}
+
+_engine = None
+
 def get_database_engine():
-    """创建数据库连接"""
+    """数据库连接（进程内只创建一次，调度器多次运行复用同一个连接池），后端由DB_BACKEND决定；连接不上时返回None"""
+    global _engine
+    from sqlalchemy import exc
+    from storage import create_engine
     try:
-        engine = create_engine(
-            f"mysql+pymysql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:"
-            f"{DB_CONFIG['port']}/{DB_CONFIG['database']}?charset={DB_CONFIG['charset']}"
-        )
-        with engine.connect():
+        if _engine is None:
+            if DB_BACKEND == 'sqlite':
+                _engine = create_engine('sqlite', path=SQLITE_PATH)
+            else:
+                _engine = create_engine(DB_BACKEND, DB_CONFIG, pool_pre_ping=True, pool_recycle=3600)
+        with _engine.connect():
             print("数据库连接成功")
-        return engine
+        return _engine
     except exc.SQLAlchemyError as e:
         print(f"数据库连接失败: {str(e)}")
         return None
 
-def create_table_if_not_exists(engine):
-    """创建数据表（如果不存在）"""
-    create_table_sql = """
-    CREATE TABLE IF NOT EXISTS university_rank (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        university_name VARCHAR(255) NOT NULL,
-        `rank` INT NOT NULL,
-        overall_score DECIMAL(10, 2),
-        location VARCHAR(255),
-        country VARCHAR(255),
-        city VARCHAR(255),
-        region VARCHAR(255),
-        logo_url TEXT,
-        path VARCHAR(500),
-        crawl_date DATE NOT NULL,
-        create_time DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-        INDEX idx_crawl_date (crawl_date),
-        INDEX idx_university (university_name),
-        INDEX idx_rank (`rank`),
-        INDEX idx_country (country)
-    ) ENGINE = InnoDB DEFAULT CHARSET = :charset COLLATE = :collation
-    """
+def dispose_engine():
+    """关闭连接池中的连接（调度器退出时调用）"""
+    if _engine is not None:
+        _engine.dispose()
+
+def create_table_if_not_exists(engine, crawl_date=None):
+    """创建数据表（如果不存在），MySQL上按crawl_date年份分区累积历史；大学信息在university_dim维度表中"""
+    from sqlalchemy import exc
+    from rank_history import create_rank_table
+    from storage import Column, Table
+    from university_dim import UniversityResolver
+    
+    table = Table(
+        'university_rank',
+        [
+            Column('university_id', 'uint', nullable=False),
+            Column('crawl_date', 'date', nullable=False),
+            Column('rank', 'int', nullable=False),
+            Column('overall_score', 'decimal'),
+            Column('create_time', 'datetime', nullable=False, default='CURRENT_TIMESTAMP')
+        ],
+        primary_key=['university_id', 'crawl_date'],
+        indexes=RANK_INDEXES,
+        mysql_options=f"COLLATE = {DB_CONFIG['collation']}"
+    )
     
     try:
-        with engine.connect() as conn:
-            conn.execute(text(create_table_sql), {
-                "charset": DB_CONFIG['charset'],
-                "collation": DB_CONFIG['collation']
-            })
-            conn.commit()
+        resolver = UniversityResolver(engine)
+        with engine.begin() as conn:
+            legacy_columns = ['rank', 'overall_score', 'crawl_date', 'create_time']
+            if create_rank_table(conn, table, legacy_columns, resolver, crawl_date):
+                print("旧表已迁移为分区表，原表保留为 university_rank_legacy")
             print("数据表检查/创建完成")
     except exc.SQLAlchemyError as e:
         print(f"表操作失败: {str(e)}")
         raise
 
 def get_session():
-    """创建requests会话，设置请求头"""
-    session = requests.Session()
-    
-    # 设置请求头，模拟真实浏览器
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'application/json, text/plain, */*',
-        'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
+    """创建requests会话（共享传输层），设置站点相关的请求头"""
+    cache = ResponseCache(HTTP_CACHE_PATH, ttl=HTTP_CACHE_TTL) if HTTP_CACHE else None
+    return create_session(1, {
         'Referer': 'https://www.topuniversities.com/world-university-rankings/2025',
         'Sec-Fetch-Dest': 'empty',
         'Sec-Fetch-Mode': 'cors',
         'Sec-Fetch-Site': 'same-origin',
         'Cache-Control': 'no-cache',
         'Pragma': 'no-cache'
-    }
-    
-    session.headers.update(headers)
-    return session
+    }, cache)
+
+def parse_universities(universities_data):
+    """解析score_nodes列表为DataFrame，无法解析的行汇总报告"""
+    from qs_parser import parse_score_nodes
+    metrics = run_metrics.get('qs_requests')
+    metrics.add_rows('fetch', len(universities_data))
+    with metrics.stage('parse', rows=len(universities_data)):
+        df, rejected = parse_score_nodes(universities_data)
+    if rejected:
+        print(f"解析失败 {rejected} 条数据（排名无法识别），已跳过")
+    return df
 
 def extract_data_from_api(session, items_per_page=30):
     """从API接口提取数据"""
-    universities = []
+    import pandas as pd
+    universities = pd.DataFrame()
     
     try:
         # QS排名API接口
@@ -122,7 +157,8 @@ def extract_data_from_api(session, items_per_page=30):
         print(f"正在请求API: {api_url}")
         print(f"请求参数: {params}")
         
-        response = session.get(api_url, params=params, timeout=30)
+        with run_metrics.get('qs_requests').profile('fetch'):
+            response = session.get(api_url, params=params)
         
         if response.status_code == 200:
             try:
@@ -135,26 +171,7 @@ def extract_data_from_api(session, items_per_page=30):
                     universities_data = data['score_nodes']
                     print(f"找到 {len(universities_data)} 个大学数据")
                     
-                    for uni in universities_data:
-                        try:
-                            # 提取基本信息
-                            university_info = {
-                                'rank': int(uni.get('rank', 0)),
-                                'overall_score': float(uni.get('overall_score', 0)) if uni.get('overall_score') else None,
-                                'university_name': uni.get('title', ''),
-                                'location': f"{uni.get('city', '')}, {uni.get('country', '')}".strip(', '),
-                                'country': uni.get('country', ''),
-                                'city': uni.get('city', ''),
-                                'region': uni.get('region', ''),
-                                'logo_url': uni.get('logo', ''),
-                                'path': uni.get('path', '')
-                            }
-                            
-                            universities.append(university_info)
-                            
-                        except Exception as e:
-                            print(f"解析单条数据失败: {e}")
-                            continue
+                    universities = parse_universities(universities_data)
                     
                     print(f"从API成功提取 {len(universities)} 条数据")
                     
@@ -177,15 +194,17 @@ def extract_data_from_api(session, items_per_page=30):
     except Exception as e:
         print(f"数据提取失败: {e}")
     
-    return pd.DataFrame(universities)
+    return universities
 
 def extract_data_from_js_url(session, js_url):
     """从JS动态加载的URL提取数据"""
-    universities = []
+    import pandas as pd
+    universities = pd.DataFrame()
     
     try:
         print(f"正在请求JS数据: {js_url}")
-        response = session.get(js_url, timeout=30)
+        with run_metrics.get('qs_requests').profile('fetch'):
+            response = session.get(js_url)
         
         if response.status_code == 200:
             # 尝试解析JSON
@@ -198,26 +217,7 @@ def extract_data_from_js_url(session, js_url):
                     universities_data = data['score_nodes']
                     print(f"找到 {len(universities_data)} 个大学数据")
                     
-                    for uni in universities_data:
-                        try:
-                            # 提取基本信息
-                            university_info = {
-                                'rank': int(uni.get('rank', 0)),
-                                'overall_score': float(uni.get('overall_score', 0)) if uni.get('overall_score') else None,
-                                'university_name': uni.get('title', ''),
-                                'location': f"{uni.get('city', '')}, {uni.get('country', '')}".strip(', '),
-                                'country': uni.get('country', ''),
-                                'city': uni.get('city', ''),
-                                'region': uni.get('region', ''),
-                                'logo_url': uni.get('logo', ''),
-                                'path': uni.get('path', '')
-                            }
-                            
-                            universities.append(university_info)
-                            
-                        except Exception as e:
-                            print(f"解析单条数据失败: {e}")
-                            continue
+                    universities = parse_universities(universities_data)
                     
                     print(f"从JS URL成功提取 {len(universities)} 条数据")
                     
@@ -240,51 +240,76 @@ def extract_data_from_js_url(session, js_url):
     except Exception as e:
         print(f"数据提取失败: {e}")
     
-    return pd.DataFrame(universities)
+    return universities
 
-def save_to_database(df, engine, crawl_date):
-    """保存数据到数据库"""
+def save_to_database(df, engine, crawl_date, mode=DB_LOAD_MODE):
+    """保存数据到数据库，重复运行同一期会整体替换/覆盖而不是重复插入
+    
+    swap模式整期数据在暂存表装载完才原子换入，读者不会看到装载到一半的数据；
+    upsert模式按 (university_id, crawl_date) 分批upsert到正式表。
+    """
+    from sqlalchemy import exc
+    from bulk_writer import bulk_upsert
+    from rank_history import exchange_load
+    from university_dim import UniversityResolver
+    
     if df.empty or engine is None:
         print("无数据可保存")
         return False
     
     df['crawl_date'] = crawl_date
+    if mode == 'swap' and engine.dialect.name != 'mysql':
+        # 分区交换只有MySQL支持，其他后端直接分批upsert
+        mode = 'upsert'
     
     try:
-        with engine.connect() as conn:
-            # 检查是否已有该日期的数据
-            result = conn.execute(
-                text("SELECT COUNT(*) FROM university_rank WHERE crawl_date = :date"),
-                {"date": crawl_date}
-            )
-            if result.scalar() > 0:
-                print(f"该日期({crawl_date})已存在数据")
-                return False
-            
-            # 直接插入数据
-            df.to_sql('university_rank', conn, if_exists='append', index=False)
-            conn.commit()
-            print(f"成功保存 {len(df)} 条数据到数据库")
-            return True
+        # 先按path、再按规范化名称解析大学id，新大学连同描述字段登记到维度表
+        df['university_id'] = UniversityResolver(engine).resolve(df).to_numpy()
+        if mode == 'swap':
+            stats = exchange_load(engine, 'university_rank', df, RANK_COLUMNS, crawl_date, RANK_INDEXES,
+                                  RANK_UPDATE_COLUMNS)
+        else:
+            stats = bulk_upsert(engine, 'university_rank', df, RANK_COLUMNS, RANK_UPDATE_COLUMNS)
+        print(f"成功保存 {stats['rows']} 条数据到数据库({mode})，装载耗时 {stats['seconds']:.2f} 秒")
+        return True
     except exc.SQLAlchemyError as e:
         print(f"数据库保存失败: {str(e)}")
         return False
 
-def scrape_qs_rankings_requests(js_url=None, items_per_page=30):
-    """使用requests爬取QS大学排名数据"""
+def trajectory(universities=None, editions=5, engine=None):
+    """最近editions期的排名/分数轨迹，每所大学一行、每期一列"""
+    from rank_history import rank_trajectory
+    engine = engine or get_database_engine()
+    df = rank_trajectory(engine, 'university_rank', universities, editions)
+    return df.pivot(index='university_name', columns='crawl_date', values=['rank', 'overall_score'])
+
+def scrape_qs_rankings_requests(js_url=None, items_per_page=30, profile=False):
+    """使用requests爬取QS大学排名数据，profile为True时按阶段做cProfile/tracemalloc剖析（报告写到logs/）
+    
+    返回入库的记录数，未提取到数据时为0；数据库连接、导出或写库失败时抛出异常（调度器据此记为失败）。
+    """
+    import pandas as pd
+    from sinks import write_frame
+    
     # 初始化数据库
     engine = get_database_engine()
     if not engine:
-        return
-    
-    create_table_if_not_exists(engine)
+        raise RuntimeError("数据库连接失败")
     
     # 设置爬取日期
     crawl_date = date.today().replace(day=1)
     print(f"爬取日期: {crawl_date}")
     
+    create_table_if_not_exists(engine, crawl_date)
+    
     # 创建会话
     session = get_session()
+    archive = ResponseArchive('qs_requests').attach(session) if ARCHIVE_RESPONSES else None
+    profiler = None
+    if profile:
+        from stage_profiler import StageProfiler
+        profiler = StageProfiler('qs_requests')
+    metrics = run_metrics.start('qs_requests', profiler=profiler).attach(session)
     
     try:
         df = pd.DataFrame()
@@ -303,23 +328,43 @@ def scrape_qs_rankings_requests(js_url=None, items_per_page=30):
             print("\n📊 数据预览:")
             print(df.head())
             
-            # 保存到Excel
-            excel_filename = f'QS大学排名_requests_{crawl_date}.xlsx'
-            df.to_excel(excel_filename, index=False)
-            print(f"数据已保存到 {excel_filename}")
+            # 保存到文件
+            export_filename = f'QS大学排名_requests_{crawl_date}.{EXPORT_FORMAT}'
+            with metrics.stage('excel', rows=len(df)):
+                write_frame(df, export_filename)
+            print(f"数据已保存到 {export_filename}")
             
             # 保存到数据库
-            save_to_database(df, engine, crawl_date)
-        else:
-            print("未提取到任何数据")
+            with metrics.stage('db', rows=len(df)):
+                saved = save_to_database(df, engine, crawl_date)
+            if not saved:
+                raise RuntimeError("数据库保存失败")
+            return len(df)
+        
+        print("未提取到任何数据")
+        return 0
             
     except Exception as e:
         print(f"爬取过程出错: {e}")
+        raise
     finally:
         session.close()
+        if archive:
+            archive.close()
+            print(f"原始响应已归档: {archive.path}")
+        try:
+            prom_path, json_path = run_metrics.finish(metrics)
+            print(f"运行指标: {json_path}，{prom_path}")
+        except OSError as e:
+            print(f"运行指标写出失败: {e}")
+        if profiler:
+            print(f"性能剖析报告: {profiler.write()}")
 
 if __name__ == "__main__":
     # 如果您有JS URL，请在这里提供
     js_url = "https://www.topuniversities.com/rankings/endpoint?nid=3990755&page=0&items_per_page=30&tab=indicators&region=&countries=&cities=&search=&star=&sort_by=&order_by=&program_type=&scholarship=&fee=&english_score=&academic_score=&mix_student=&loggedincache=6905039-1754356589358"  # 例如: "https://api.example.com/rankings"
     
-    scrape_qs_rankings_requests(js_url) 
\ No newline at end of file
+    try:
+        scrape_qs_rankings_requests(js_url, profile='--profile' in sys.argv)
+    except Exception:
+        sys.exit(1)
\ No newline at end of file
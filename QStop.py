@@ -1,13 +1,24 @@
+"""QS世界大学排名爬虫（分页接口）
+
+作为模块导入时没有副作用：日志、会话、数据库连接都在 main()/run() 中创建，
+pandas、SQLAlchemy 等较重的依赖在用到的阶段才导入。
+"""
 import requests
 import json
-import pandas as pd
 import time
-from sqlalchemy import create_engine, text
 from datetime import date, datetime
 import logging
+from functools import partial
 import os
+import sys
+import tempfile
 import traceback
-import urllib3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from rate_limiter import AdaptiveRateLimiter
+from http_cache import ResponseCache, is_cached
+from http_transport import create_session, backoff_delay, RETRY_STATUSES
+from response_archive import ResponseArchive
+import run_metrics
 
 # 数据库配置
 DB_CONFIG = {
@@ -18,6 +29,36 @@ DB_CONFIG = {
     'port': 3306,
     'charset': 'utf8mb4'
 }
+DB_BACKEND = 'mysql'        # 数据库后端：'mysql' / 'sqlite'（不需要数据库服务，见storage.py）
+SQLITE_PATH = 'data/qs.sqlite'   # 与QS_requests.py共用，university_dim维度表也在其中
+
+# 抓取配置
+API_URL = "https://www.topuniversities.com/rankings/endpoint"
+FETCH_MODE = 'concurrent'   # 'concurrent' 并发抓取 / 'sequential' 逐页抓取
+MAX_WORKERS = 8             # 并发请求上限
+REQUESTS_PER_SECOND = 5     # 全局每秒请求数上限（限速器在此之下自适应调整）
+MAX_PAGES = None            # 最多抓取页数，None表示全部
+PAGE_RETRIES = 3            # 单页最多尝试次数
+HTTP_CACHE = True           # 本地响应缓存，重复运行时直接读磁盘
+HTTP_CACHE_PATH = 'cache/qs_http_cache.sqlite'
+HTTP_CACHE_TTL = 30 * 24 * 3600   # QS排名每年更新一次，缓存30天
+ARCHIVE_RESPONSES = True    # 原始响应归档到archive/，可用reparse.py离线重新解析
+EXPORT_FORMAT = 'xlsx'       # 导出文件格式：'xlsx' / 'csv' / 'parquet'（parquet需要pyarrow）
+CHECKPOINT = True           # 记录已入库的页到state/，中断后重跑从断点继续
+CHECKPOINT_MAX_AGE = 36 * 3600  # 超过该时长没有进展的断点作废（大于每日调度间隔，次日运行总是续爬）
+CHANGE_FEED = True          # 与上次完整爬取比较，输出排名/分数变化事件到changes/
+
+# 写库配置
+DB_WRITE_MODE = 'bulk'      # 'rows' 逐行upsert / 'bulk' 分批多行upsert / 'load_data' LOAD DATA + INSERT ... SELECT
+DB_BATCH_SIZE = 1000        # bulk模式每批行数
+BACKGROUND_WRITE = True     # 边抓取边由后台线程写库
+WRITE_QUEUE_SIZE = 8        # 后台写入队列长度（页数），写库跟不上时抓取会被阻塞
+SIMPLE_COLUMNS = ['rank', 'overall_score', 'university_name', 'country', 'city']
+PARSE_COLUMNS = SIMPLE_COLUMNS + ['path']   # path用于解析大学id，不输出到导出文件
+RANK_COLUMNS = ['university_id', 'rank', 'overall_score', 'crawl_date']
+RANK_UPDATE_COLUMNS = ['rank', 'overall_score']
+# 到运行时限后未发出的页
+DEADLINE_SKIPPED = object()
 
 # 设置日志
 def setup_logging():
@@ -34,66 +75,68 @@ def setup_logging():
             logging.FileHandler(f'logs/qs_crawler_{datetime.now().strftime("%Y%m%d")}.log', encoding='utf-8')
         ]
     )
-    logger = logging.getLogger(__name__)
-    
     logger.info("-" * 50)
     
     return logger
 
-logger = setup_logging()
+logger = logging.getLogger(__name__)
 
 def log_error_notification(error, context=""):
     """记录错误到日志文件"""
     logger.error(f"错误: {context} - {error}")
     logger.error(f"堆栈: {traceback.format_exc()}")
 
-def create_table_if_not_exists(engine):
-    """创建数据表"""
-    drop_sql = "DROP TABLE IF EXISTS university_rank_simple"
-    create_sql = """
-    CREATE TABLE university_rank_simple (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        `rank` INT NOT NULL,
-        overall_score DECIMAL(10, 2),
-        university_name VARCHAR(255) NOT NULL,
-        country VARCHAR(100),
-        city VARCHAR(100),
-        crawl_date DATE NOT NULL,
-        is_deleted TINYINT(1) NOT NULL DEFAULT 0,
-        create_time DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-        UNIQUE KEY uk_university_date (university_name, crawl_date),
-        INDEX idx_rank (`rank`),
-        INDEX idx_crawl_date (crawl_date),
-        INDEX idx_country (country),
-        INDEX idx_is_deleted (is_deleted)
-    ) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4
+def create_table_if_not_exists(engine, crawl_date=None):
+    """创建数据表（按crawl_date分区累积历史，不再每次重建），并保证crawl_date所在年份的分区存在
+    
+    大学名称、国家、城市在university_dim维度表中，事实表只存university_id。
+    建表语句按引擎对应的后端生成，SQLite后端不分区。
     """
+    from rank_history import create_rank_table
+    from storage import Column, Table
+    from university_dim import UniversityResolver
+    
+    table = Table(
+        'university_rank_simple',
+        [
+            Column('university_id', 'uint', nullable=False),
+            Column('crawl_date', 'date', nullable=False),
+            Column('rank', 'int', nullable=False),
+            Column('overall_score', 'decimal'),
+            Column('is_deleted', 'bool', nullable=False, default='0'),
+            Column('create_time', 'datetime', nullable=False, default='CURRENT_TIMESTAMP')
+        ],
+        primary_key=['university_id', 'crawl_date'],
+        indexes={'idx_crawl_date_rank': ['crawl_date', 'rank'], 'idx_is_deleted': ['is_deleted']}
+    )
+    legacy_columns = ['rank', 'overall_score', 'crawl_date', 'is_deleted', 'create_time']
     
     try:
-        with engine.connect() as conn:
-            conn.execute(text(drop_sql))
-            conn.execute(text(create_sql))
-            conn.commit()
+        resolver = UniversityResolver(engine)
+        with engine.begin() as conn:
+            if create_rank_table(conn, table, legacy_columns, resolver, crawl_date):
+                logger.info("旧表已迁移为分区表，原表保留为 university_rank_simple_legacy")
     except Exception as e:
         logger.error(f"创建数据表失败: {e}")
         log_error_notification(e, "创建数据表失败")
 
-session = requests.Session()
-session.headers.update({
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-    'Accept': 'application/json, text/plain, */*',
-    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-    'Accept-Encoding': 'gzip, deflate, br',
-    'Connection': 'keep-alive',
-    'Referer': 'https://www.topuniversities.com/world-university-rankings/2025',
-    'Sec-Fetch-Dest': 'empty',
-    'Sec-Fetch-Mode': 'cors',
-    'Sec-Fetch-Site': 'same-origin',
-    'Cache-Control': 'no-cache',
-    'Pragma': 'no-cache'
-})
-session.verify = False
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+def trajectory(universities=None, editions=5, engine=None):
+    """最近editions期的排名/分数轨迹，每所大学一行、每期一列"""
+    from rank_history import rank_trajectory
+    df = rank_trajectory(engine or get_engine(), 'university_rank_simple', universities, editions)
+    return df.pivot(index='university_name', columns='crawl_date', values=['rank', 'overall_score'])
+
+def get_session(archive=None):
+    """创建会话（共享传输层，连接池大小等于并发数），传入archive时记录收到的每个原始响应"""
+    cache = ResponseCache(HTTP_CACHE_PATH, ttl=HTTP_CACHE_TTL) if HTTP_CACHE else None
+    return create_session(MAX_WORKERS, {
+        'Referer': 'https://www.topuniversities.com/world-university-rankings/2025',
+        'Sec-Fetch-Dest': 'empty',
+        'Sec-Fetch-Mode': 'cors',
+        'Sec-Fetch-Site': 'same-origin',
+        'Cache-Control': 'no-cache',
+        'Pragma': 'no-cache'
+    }, cache, archive)
 
 params = {
     'nid': '3990755', 'page': 0, 'items_per_page': 30, 'tab': 'indicators',
@@ -103,116 +146,517 @@ params = {
     'loggedincache': '6905039-1754356589358'
 }
 
-all_universities = []
-page = 0
-max_pages = 5
+def parse_universities(data):
+    """解析单页score_nodes数据，返回 (DataFrame, 被拒绝的行数)"""
+    from qs_parser import parse_score_nodes
+    metrics = run_metrics.get('qstop')
+    nodes = data['score_nodes']
+    metrics.add_rows('fetch', len(nodes))
+    with metrics.stage('parse', rows=len(nodes)):
+        return parse_score_nodes(nodes, PARSE_COLUMNS)
 
-try:
-    while page < max_pages:
-        params['page'] = page
-        
+def combine_pages(frames, rejected):
+    """合并各页数据，汇总报告解析失败的行数"""
+    import pandas as pd
+    if rejected:
+        logger.warning(f"解析跳过 {rejected} 条数据（排名无法识别）")
+    if not frames:
+        return pd.DataFrame(columns=PARSE_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+def fetch_page(session, page, limiter=None, retries=PAGE_RETRIES, deadline=None):
+    """请求单页数据，网络异常和429/5xx时有限次重试（指数退避加抖动），返回JSON或None
+
+    限速等待和重试退避可能越过deadline：等待结束后再检查一次，已到时限则不发请求，返回DEADLINE_SKIPPED。
+    """
+    page_params = dict(params, page=page)
+    # 命中缓存的请求不占用限速配额
+    throttled = limiter and not is_cached(session, 'GET', API_URL, params=page_params)
+    metrics = run_metrics.get('qstop')
+    for attempt in range(retries):
+        if attempt:
+            metrics.count('retries')
+            time.sleep(backoff_delay(attempt))
+        if throttled:
+            limiter.acquire()
+        if past_deadline(deadline):
+            return DEADLINE_SKIPPED
         try:
-            response = session.get("https://www.topuniversities.com/rankings/endpoint", params=params, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if 'score_nodes' in data:
-                    for uni in data['score_nodes']:
-                        try:
-                            all_universities.append({
-                                'rank': int(uni.get('rank', 0)),
-                                'overall_score': float(uni.get('overall_score', 0)),
-                                'university_name': uni.get('title', ''),
-                                'country': uni.get('country', ''),
-                                'city': uni.get('city', '')
-                            })
-                        except Exception as e:
-                            continue
-                    
-                    if page + 1 >= data.get('total_pages', 1):
-                        break
-                else:
-                    logger.warning("数据格式异常")
-                    break
-            else:
-                logger.error(f"请求失败: {response.status_code}")
-                break
-        except requests.exceptions.Timeout:
-            logger.error("请求超时，重试中...")
-            time.sleep(2)
-            continue
+            start = time.monotonic()
+            with metrics.profile('fetch'):
+                response = session.get(API_URL, params=page_params)
+            if throttled:
+                limiter.on_response(response.status_code, time.monotonic() - start)
+            if response.status_code in RETRY_STATUSES:
+                logger.warning(f"第{page}页请求失败: {response.status_code}，重试中...")
+                continue
+            if response.status_code != 200:
+                logger.error(f"第{page}页请求失败: {response.status_code}")
+                return None
+            return response.json()
+        # requests的JSONDecodeError同时也是RequestException，要先捕获
+        except json.JSONDecodeError as e:
+            logger.error(f"第{page}页数据解析失败: {e}")
+            return None
         except requests.exceptions.RequestException as e:
-            logger.error(f"网络异常: {str(e)[:100]}...")
-            time.sleep(3)
+            # 传输层已对连接失败/读超时重试过，到这里说明连续失败
+            logger.error(f"第{page}页网络异常: {str(e)[:100]}...")
+            metrics.count('errors')
+            if throttled:
+                limiter.on_error()
+    logger.error(f"第{page}页请求失败，已尝试{retries}次")
+    return None
+
+def past_deadline(deadline):
+    return deadline is not None and time.monotonic() > deadline
+
+def fetch_all_sequential(session, max_pages=MAX_PAGES, on_page=None, checkpoint=None, deadline=None):
+    """逐页抓取（原有方式），每页解析后调用on_page(page, df)；跳过断点中已提交的页
+    
+    deadline为time.monotonic()时刻，到点后不再请求新页，已抓到的页照常返回。
+    """
+    frames = []
+    rejected = 0
+    page = 0
+    total_pages = checkpoint.last_page if checkpoint else None
+    while max_pages is None or page < max_pages:
+        if total_pages is not None and page >= total_pages:
+            break
+        if past_deadline(deadline):
+            logger.warning(f"已到运行时限，停止抓取（下一页: 第{page}页）")
+            break
+        if page > 0 and checkpoint and checkpoint.is_committed(page):
+            page += 1
             continue
-        except json.JSONDecodeError as e:
-            logger.error(f"数据解析失败: {e}")
+        
+        cached = is_cached(session, 'GET', API_URL, params=dict(params, page=page))
+        data = fetch_page(session, page, deadline=deadline)
+        if data is DEADLINE_SKIPPED:
+            logger.warning(f"已到运行时限，停止抓取（下一页: 第{page}页）")
+            break
+        if not data or 'score_nodes' not in data:
+            logger.warning(f"第{page}页数据格式异常或多次重试失败，停止抓取")
             break
         
+        total_pages = int(data.get('total_pages', 1))
+        if max_pages is not None:
+            total_pages = min(total_pages, max_pages)
+        if checkpoint:
+            checkpoint.set_last_page(total_pages)
+        if not (checkpoint and checkpoint.is_committed(page)):
+            page_df, page_rejected = parse_universities(data)
+            frames.append(page_df)
+            rejected += page_rejected
+            if on_page:
+                on_page(page, page_df)
+        
         page += 1
-        time.sleep(1)
+        if not cached:
+            time.sleep(1)
+    return combine_pages(frames, rejected)
+
+def fetch_all_concurrent(session, max_pages=MAX_PAGES, max_workers=MAX_WORKERS, rate=REQUESTS_PER_SECOND,
+                         on_page=None, checkpoint=None, deadline=None):
+    """并发抓取：先取第0页得到total_pages，再用线程池抓取其余页，每页解析后调用on_page(page, df)
+    
+    deadline为time.monotonic()时刻，到点后不再发出新请求，已在途的页照常处理。
+    """
+    limiter = AdaptiveRateLimiter(initial_rate=rate, max_rate=rate)
+    
+    def fetch(page):
+        if past_deadline(deadline):
+            return DEADLINE_SKIPPED
+        return fetch_page(session, page, limiter, deadline=deadline)
+    
+    first = fetch_page(session, 0, limiter, deadline=deadline)
+    if first is DEADLINE_SKIPPED:
+        logger.warning("已到运行时限，停止抓取（下一页: 第0页）")
+        return combine_pages([], 0)
+    if not first or 'score_nodes' not in first:
+        logger.warning("数据格式异常")
+        return combine_pages([], 0)
     
-    logger.info(f"爬取完成: {len(all_universities)} 条数据")
+    total_pages = int(first.get('total_pages', 1))
+    if max_pages is not None:
+        total_pages = min(total_pages, max_pages)
+    if checkpoint:
+        checkpoint.set_last_page(total_pages)
+    todo = [p for p in range(1, total_pages) if not (checkpoint and checkpoint.is_committed(p))]
+    logger.info(f"共 {total_pages} 页，待抓取 {len(todo) + 1} 页，并发数 {max_workers}，限速 {rate} 次/秒")
+    
+    pages = {}
+    rejected = 0
+    if not (checkpoint and checkpoint.is_committed(0)):
+        pages[0], rejected = parse_universities(first)
+        if on_page:
+            on_page(0, pages[0])
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fetch, p): p for p in todo}
+        skipped = 0
+        for future in as_completed(futures):
+            page = futures[future]
+            data = future.result()
+            if data is DEADLINE_SKIPPED:
+                skipped += 1
+                continue
+            if not data or 'score_nodes' not in data:
+                logger.error(f"第{page}页抓取失败，已跳过")
+                continue
+            pages[page], page_rejected = parse_universities(data)
+            rejected += page_rejected
+            if on_page:
+                on_page(page, pages[page])
+    
+    if skipped:
+        logger.warning(f"已到运行时限，{skipped}页未抓取")
+    run_metrics.get('qstop').count('rate_limit_wait_seconds', limiter.waited)
+    return combine_pages([pages[page] for page in sorted(pages)], rejected)
+
+_engines = {}
 
-except Exception as e:
-    logger.error(f"爬取失败: {e}")
-    log_error_notification(e, "爬取数据失败")
+def get_engine(local_infile=False):
+    """数据库连接（进程内只创建一次，调度器多次运行复用同一个连接池），后端由DB_BACKEND决定；
+    MySQL的load_data模式需要开启local_infile，用单独的连接池"""
+    from storage import create_engine
+    key = (DB_BACKEND, DB_BACKEND == 'mysql' and local_infile)
+    if key not in _engines:
+        if DB_BACKEND == 'sqlite':
+            _engines[key] = create_engine('sqlite', path=SQLITE_PATH)
+        else:
+            connect_args = {'local_infile': True} if local_infile else {}
+            _engines[key] = create_engine(DB_BACKEND, DB_CONFIG, connect_args=connect_args,
+                                          pool_pre_ping=True, pool_recycle=3600)
+    return _engines[key]
+
+def dispose_engine():
+    """关闭连接池中的连接（调度器退出时调用）"""
+    for engine in _engines.values():
+        engine.dispose()
+
+def write_rows(engine, df):
+    """逐行upsert（原有方式）；NaN（如601名以后没有总分）转为NULL，pymysql不接受NaN"""
+    from sqlalchemy import text
+    from bulk_writer import iter_rows
+    sql = """
+    INSERT INTO university_rank_simple 
+    (university_id, `rank`, overall_score, crawl_date)
+    VALUES (:university_id, :rank, :overall_score, :crawl_date)
+    ON DUPLICATE KEY UPDATE
+    `rank` = VALUES(`rank`),
+    overall_score = VALUES(overall_score)
+    """
+    columns = ['university_id', 'rank', 'overall_score', 'crawl_date']
+    with engine.connect() as conn:
+        for row in iter_rows(df, columns):
+            conn.execute(text(sql), dict(zip(columns, row)))
+        conn.commit()
 
-if all_universities:
-    df = pd.DataFrame(all_universities)
-    current_date = date.today()
+def write_bulk(engine, df):
+    """分批多行upsert"""
+    from bulk_writer import bulk_upsert
+    bulk_upsert(engine, 'university_rank_simple', df, RANK_COLUMNS, RANK_UPDATE_COLUMNS,
+                batch_size=DB_BATCH_SIZE)
+
+def write_load_data(engine, df):
+    """写临时CSV，LOAD DATA LOCAL INFILE进临时表，再一条INSERT ... SELECT合并到正式表"""
+    from sqlalchemy import text
+    staging_sql = """
+    CREATE TEMPORARY TABLE university_rank_simple_staging (
+        university_id INT UNSIGNED NOT NULL,
+        `rank` INT NOT NULL,
+        overall_score DECIMAL(10, 2),
+        crawl_date DATE NOT NULL
+    ) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4
+    """
+    merge_sql = """
+    INSERT INTO university_rank_simple
+    (university_id, `rank`, overall_score, crawl_date)
+    SELECT university_id, `rank`, overall_score, crawl_date
+    FROM university_rank_simple_staging
+    ON DUPLICATE KEY UPDATE
+    `rank` = VALUES(`rank`),
+    overall_score = VALUES(overall_score)
+    """
     
-    try:
-        excel_filename = f'QS大学排名{current_date}.xlsx'
-        df.to_excel(excel_filename, index=False)
-        logger.info(f"Excel: {excel_filename}")
-    except Exception as e:
-        logger.error(f"Excel保存失败: {e}")
-        log_error_notification(e, "保存Excel文件失败")
+    # 事实表只有数值和日期列，LOAD DATA中\N表示NULL
+    csv_df = df[RANK_COLUMNS]
     
+    fd, csv_path = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
     try:
-        engine = create_engine(
-            f"mysql+pymysql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:"
-            f"{DB_CONFIG['port']}/{DB_CONFIG['database']}?charset={DB_CONFIG['charset']}"
-        )
-        
-        create_table_if_not_exists(engine)
-        
+        csv_df.to_csv(csv_path, index=False, header=False, na_rep='\\N', lineterminator='\n', encoding='utf-8')
+        load_sql = f"""
+        LOAD DATA LOCAL INFILE '{csv_path.replace(os.sep, '/')}'
+        INTO TABLE university_rank_simple_staging
+        CHARACTER SET utf8mb4
+        FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"'
+        LINES TERMINATED BY '\\n'
+        (university_id, `rank`, overall_score, crawl_date)
+        """
         with engine.connect() as conn:
-            for _, row in df.iterrows():
-                sql = """
-                INSERT INTO university_rank_simple 
-                (`rank`, overall_score, university_name, country, city, crawl_date)
-                VALUES (:rank, :overall_score, :university_name, :country, :city, :crawl_date)
-                ON DUPLICATE KEY UPDATE
-                `rank` = VALUES(`rank`),
-                overall_score = VALUES(overall_score),
-                country = VALUES(country),
-                city = VALUES(city)
-                """
-                conn.execute(text(sql), {
-                    'rank': row['rank'],
-                    'overall_score': row['overall_score'],
-                    'university_name': row['university_name'],
-                    'country': row['country'],
-                    'city': row['city'],
-                    'crawl_date': current_date
-                })
+            conn.execute(text("DROP TEMPORARY TABLE IF EXISTS university_rank_simple_staging"))
+            conn.execute(text(staging_sql))
+            conn.execute(text(load_sql))
+            conn.execute(text(merge_sql))
+            conn.execute(text("DROP TEMPORARY TABLE university_rank_simple_staging"))
             conn.commit()
+    finally:
+        os.remove(csv_path)
+
+WRITE_MODES = {
+    'rows': write_rows,
+    'bulk': write_bulk,
+    'load_data': write_load_data
+}
+# 只有MySQL支持的写库模式（ON DUPLICATE KEY 单行语句、LOAD DATA），其他后端改用bulk
+MYSQL_WRITE_MODES = ['rows', 'load_data']
+
+def write_mode_for(engine, mode):
+    """引擎对应的后端不支持该写库模式时退化为bulk"""
+    if mode in MYSQL_WRITE_MODES and engine.dialect.name != 'mysql':
+        logger.warning(f"{engine.dialect.name} 后端不支持 {mode} 写库模式，改用 bulk")
+        return 'bulk'
+    return mode
+
+def save_to_database(engine, df, mode=DB_WRITE_MODE, resolver=None):
+    """按指定模式写入university_rank_simple，返回耗时(秒)"""
+    from university_dim import UniversityResolver
+    resolver = resolver or UniversityResolver(engine)
+    mode = write_mode_for(engine, mode)
+    start = time.perf_counter()
+    WRITE_MODES[mode](engine, resolver.assign_ids(df))
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    logger.info(f"数据库({mode}): {len(df)} 条记录，耗时 {elapsed:.2f} 秒，{len(df) / elapsed:.0f} 条/秒")
+    return elapsed
+
+def benchmark_write_modes(engine, df):
+    """依次用各写库模式写入同一批数据并对比耗时（upsert可重复执行）"""
+    from university_dim import UniversityResolver
+    resolver = UniversityResolver(engine)
+    modes = WRITE_MODES if engine.dialect.name == 'mysql' else ['bulk']
+    results = {mode: save_to_database(engine, df, mode, resolver) for mode in modes}
+    baseline = next(iter(results.values()))
+    for mode, elapsed in results.items():
+        logger.info(f"写库基准 {mode}: {elapsed:.2f} 秒 ({baseline / elapsed:.1f}x)")
+        print(f"{mode}: {elapsed:.2f} 秒 ({baseline / elapsed:.1f}x)")
+    return results
+
+class RankDbSink:
+    """写库sink：按DB_WRITE_MODE把数据块写入university_rank_simple，供后台写入线程使用"""
+    
+    def __init__(self, engine, mode=DB_WRITE_MODE):
+        from university_dim import UniversityResolver
+        self.engine = engine
+        self.mode = write_mode_for(engine, mode)
+        self.resolver = UniversityResolver(engine)
+        self.rows = 0
+        self.seconds = 0.0
+    
+    def write(self, df):
+        start = time.perf_counter()
+        WRITE_MODES[self.mode](self.engine, self.resolver.assign_ids(df))
+        self.seconds += time.perf_counter() - start
+        self.rows += len(df)
+    
+    def close(self):
+        rate = self.rows / self.seconds if self.seconds > 0 else 0.0
+        logger.info(f"数据库({self.mode}): {self.rows} 条记录，耗时 {self.seconds:.2f} 秒，{rate:.0f} 条/秒")
+
+def page_writer(writer, crawl_date, checkpoint=None):
+    """返回逐页回调：把每页数据放入后台写入队列（队列满时阻塞抓取），入库成功后提交断点"""
+    def on_page(page, page_df):
+        if writer.error:
+            return
+        page_df = page_df.assign(crawl_date=crawl_date)
+        on_done = partial(checkpoint.commit, [page], page_df) if checkpoint else None
+        if page_df.empty:
+            if on_done:
+                on_done()
+            return
+        try:
+            writer.write(page_df, on_done=on_done)
+        except Exception:
+            # 写线程的异常在close()时统一报告
+            pass
+    return on_page
+
+def run(benchmark_db=False, session=None, profile=False, deadline=None):
+    """完整运行一次：抓取 -> 写库（后台线程） -> 导出文件 -> 变化事件，返回本次抓取的DataFrame
+    
+    benchmark_db为True时不记录断点，抓取后依次用各写库模式写入并对比耗时。
+    传入session时复用该会话（调度器跨次保持的长连接），用完不关闭；
+    deadline为time.monotonic()时刻，到点后不再请求新页，已抓到的页照常入库，未抓的页留给断点续爬。
+    profile为True时按阶段做cProfile/tracemalloc剖析，报告写到logs/。
+    写库失败时导出文件、断点和运行指标照常处理，最后抛出RuntimeError，调度器据此把这次运行记为失败。
+    """
+    import pandas as pd
+    from background_writer import BackgroundWriter
+    from crawl_checkpoint import CrawlCheckpoint
+    from change_feed import ChangeFeed, summarize
+    
+    own_session = session is None
+    session = session or get_session()
+    archive = ResponseArchive('qstop').attach(session) if ARCHIVE_RESPONSES else None
+    profiler = None
+    if profile:
+        from stage_profiler import StageProfiler
+        profiler = StageProfiler('qstop')
+    metrics = run_metrics.start('qstop', profiler=profiler).attach(session)
+    
+    all_universities = pd.DataFrame()
+    checkpoint = None
+    if CHECKPOINT and not benchmark_db:
+        checkpoint = CrawlCheckpoint('qstop', max_age=CHECKPOINT_MAX_AGE)
+        if checkpoint.resumed:
+            logger.info(f"从断点继续: 已提交至第{checkpoint.committed_through + 1}页，"
+                        f"之前已入库 {checkpoint.partial_rows} 条")
+    current_date = checkpoint.crawl_date if checkpoint else date.today()
+    resumed = bool(checkpoint and checkpoint.resumed)
+    writer = None
+    db_error = None
+    
+    if BACKGROUND_WRITE and not benchmark_db:
+        try:
+            engine = get_engine(local_infile=DB_WRITE_MODE == 'load_data')
+            create_table_if_not_exists(engine, current_date)
+            sink = metrics.wrap_sink('db', RankDbSink(engine))
+            writer = BackgroundWriter(sink, max_queue=WRITE_QUEUE_SIZE, batch_rows=DB_BATCH_SIZE,
+                                      name='qs-db-writer')
+        except Exception as e:
+            logger.error(f"数据库保存失败: {e}")
+            log_error_notification(e, "保存到数据库失败")
+            db_error = e
+    
+    fetched_pages = []
+    try:
+        start_time = time.time()
+        write_page = page_writer(writer, current_date, checkpoint) if writer else None
+        
+        def on_page(page, page_df):
+            # 非后台写入时整批入库成功后再提交断点
+            fetched_pages.append(page)
+            if write_page:
+                write_page(page, page_df)
         
-        logger.info(f"数据库: {len(df)} 条记录")
+        if FETCH_MODE == 'concurrent':
+            all_universities = fetch_all_concurrent(session, on_page=on_page, checkpoint=checkpoint,
+                                                    deadline=deadline)
+        else:
+            all_universities = fetch_all_sequential(session, on_page=on_page, checkpoint=checkpoint,
+                                                    deadline=deadline)
         
+        logger.info(f"爬取完成: {len(all_universities)} 条数据，耗时 {time.time() - start_time:.1f} 秒")
+    
     except Exception as e:
-        logger.error(f"数据库保存失败: {e}")
-        log_error_notification(e, "保存到数据库失败")
-else:
-    logger.warning("无数据可保存")
-
-session.close()
-logger.info("-" * 50)
-
-# 终端反馈完成信息
-if all_universities:
-    print(f"完成: {len(all_universities)} 条数据")
-else:
-    print("爬取失败") 
\ No newline at end of file
+        logger.error(f"爬取失败: {e}")
+        log_error_notification(e, "爬取数据失败")
+    
+    if writer:
+        try:
+            writer.close()
+            metrics.count('db_backpressure_seconds', writer.blocked_seconds)
+            if writer.blocked_seconds > 1:
+                logger.info(f"写库跟不上抓取，抓取因背压等待 {writer.blocked_seconds:.1f} 秒")
+        except Exception as e:
+            logger.error(f"数据库保存失败: {e}")
+            log_error_notification(e, "保存到数据库失败")
+            db_error = e
+    
+    if not all_universities.empty:
+        df = all_universities
+        if resumed and checkpoint.partial_rows:
+            # 之前运行已入库的页只补进导出文件，保证导出文件是完整的一轮
+            previous = pd.concat(checkpoint.iter_partial(), ignore_index=True)[SIMPLE_COLUMNS]
+            df = pd.concat([previous, df], ignore_index=True).sort_values('rank', kind='stable')
+        
+        try:
+            from sinks import write_frame
+            export_filename = f'QS大学排名{current_date}.{EXPORT_FORMAT}'
+            with metrics.stage('excel', rows=len(df)):
+                write_frame(df[SIMPLE_COLUMNS], export_filename)
+            logger.info(f"导出文件: {export_filename}")
+        except Exception as e:
+            logger.error(f"文件保存失败: {e}")
+            log_error_notification(e, "保存导出文件失败")
+        
+        # 后台写入模式下数据已在抓取过程中入库
+        if not writer:
+            try:
+                db_df = all_universities.assign(crawl_date=current_date)
+                engine = get_engine(local_infile=DB_WRITE_MODE == 'load_data' or benchmark_db)
+            
+                create_table_if_not_exists(engine, current_date)
+            
+                if benchmark_db:
+                    benchmark_write_modes(engine, db_df)
+                else:
+                    with metrics.stage('db', rows=len(db_df)):
+                        save_to_database(engine, db_df)
+                    if checkpoint:
+                        checkpoint.commit(fetched_pages, db_df)
+            
+            except Exception as e:
+                logger.error(f"数据库保存失败: {e}")
+                log_error_notification(e, "保存到数据库失败")
+                db_error = e
+        
+        # 只在抓取完整时比较，避免把没抓到的大学误报为删除
+        crawl_complete = checkpoint is None or checkpoint.is_complete(fetched_pages)
+        if CHANGE_FEED and crawl_complete and not benchmark_db:
+            try:
+                feed = ChangeFeed('qstop', 'university_name', ['rank', 'overall_score'])
+                feed.add(df)
+                events, path = feed.publish(current_date)
+                if path:
+                    logger.info(f"变化事件: {summarize(events) or '无变化'}，已写入 {path}")
+            except Exception as e:
+                logger.error(f"变化事件生成失败: {e}")
+                log_error_notification(e, "生成变化事件失败")
+    else:
+        logger.warning("无数据可保存")
+    
+    if checkpoint:
+        if checkpoint.is_complete():
+            checkpoint.finish()
+        else:
+            logger.warning(f"爬取未完成，已提交至第{checkpoint.committed_through + 1}页，"
+                           f"重新运行将从断点继续: {checkpoint.path}")
+    
+    metrics.detach(session)
+    if archive:
+        archive.detach(session)
+        archive.close()
+        logger.info(f"原始响应已归档: {archive.path}")
+    try:
+        prom_path, json_path = run_metrics.finish(metrics)
+        logger.info(f"运行指标: {json_path}，{prom_path}")
+    except OSError as e:
+        logger.error(f"运行指标写出失败: {e}")
+    if profiler:
+        logger.info(f"性能剖析报告: {profiler.write()}")
+    if own_session:
+        session.close()
+    if db_error is not None:
+        raise RuntimeError(f"数据库保存失败: {db_error}") from db_error
+    return all_universities
+
+def main(argv=None):
+    """命令行入口：python QStop.py [--benchmark-db] [--profile]"""
+    argv = sys.argv[1:] if argv is None else argv
+    setup_logging()
+    try:
+        all_universities = run(benchmark_db='--benchmark-db' in argv, profile='--profile' in argv)
+    except RuntimeError:
+        # 错误已记录，导出文件照常生成；以非零状态退出，外部调度可以感知
+        print("写库失败")
+        sys.exit(1)
+    logger.info("-" * 50)
+    
+    # 终端反馈完成信息
+    if not all_universities.empty:
+        print(f"完成: {len(all_universities)} 条数据")
+    else:
+        print("爬取失败")
+
+if __name__ == "__main__":
+    main() 
@@ -0,0 +1,90 @@
+"""后台写入线程：让网络抓取和写库重叠进行
+
+生产者（抓取线程）把数据块放进有界队列，写线程攒够一批后交给下游sink。
+队列满时 write() 阻塞，抓取自动放慢到数据库跟得上的速度（背压）。
+"""
+import queue
+import threading
+import time
+
+import pandas as pd
+
+_STOP = object()
+
+
+class BackgroundWriter:
+    """包装一个带 write(df)/close() 的sink，在独立线程中按批写入"""
+
+    def __init__(self, sink, max_queue=4, batch_rows=1000, name='background-writer'):
+        self.sink = sink
+        self.batch_rows = batch_rows
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.error = None
+        self.rows = 0
+        self.blocked_seconds = 0.0
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def write(self, df, on_done=None):
+        """放入一个数据块，队列满时阻塞；写线程出错后抛出该异常
+
+        on_done在该块所在批次写入成功后于写线程中调用（用于记录断点等）。
+        """
+        start = time.perf_counter()
+        self._put((df, on_done))
+        self.blocked_seconds += time.perf_counter() - start
+
+    def close(self):
+        """写完剩余数据、关闭下游sink并等待写线程结束"""
+        if self.thread.is_alive():
+            try:
+                self._put(_STOP)
+            except Exception:
+                pass
+            self.thread.join()
+        if self.error:
+            raise self.error
+        self.sink.close()
+
+    def _put(self, item):
+        while True:
+            if self.error:
+                raise self.error
+            try:
+                self.queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _run(self):
+        buffered = []
+        buffered_rows = 0
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            buffered.append(item)
+            buffered_rows += len(item[0])
+            # 攒够一批，或者队列暂时空了，就写一次
+            if buffered_rows >= self.batch_rows or self.queue.empty():
+                if not self._flush(buffered):
+                    return
+                buffered = []
+                buffered_rows = 0
+        if buffered:
+            self._flush(buffered)
+
+    def _flush(self, items):
+        try:
+            frames = [df for df, _ in items]
+            df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+            self.sink.write(df)
+            self.rows += len(df)
+            for _, on_done in items:
+                if on_done:
+                    on_done()
+            return True
+        except Exception as e:
+            # 写线程随即退出，生产者下一次 write() 会收到该异常
+            self.error = e
+            return False
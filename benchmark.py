@@ -0,0 +1,241 @@
+"""离线基准测试：不访问线上接口和MySQL，给每个阶段一个可重复的吞吐数字
+
+阶段:
+    fetch_qs      QStop 并发抓取（含解析），对本地模拟接口（mock_server.py）
+    fetch_fund    fund_crawler 分页生成器抓取，对本地模拟接口
+    parse         qs_parser 解析 score_nodes（每页30条）
+    normalize     fund_crawler 整块规范化（每块 CHUNK_SIZE 条）
+    excel         ExcelStreamSink 分块写xlsx
+    csv           CsvStreamSink 分块写CSV
+    parquet       ParquetSink 分块写Parquet（未安装pyarrow时跳过）
+    db            FundPersonnelDbSink 写SQLite后端（storage.py）：首次写入 + 同一批数据再写一次（全部走更新）
+
+抓取阶段解除限速，测的是爬虫客户端对本地服务的上限；--latency/--error-rate 模拟源站延迟和错误。
+其他阶段的数据由 mock_server 的合成数据生成器产生，生成本身不计时。
+
+用法:
+    python benchmark.py                                   1k 和 100k 行，全部阶段
+    python benchmark.py --sizes 1000000 --stages normalize excel db --repeat 1
+    python benchmark.py --latency 0.05 --error-rate 0.01 --stages fetch_fund --json bench.json
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date
+from functools import partial
+
+import mock_server
+import run_metrics
+
+SIZES = [1000, 100000]
+STAGES = ['fetch_qs', 'fetch_fund', 'parse', 'normalize', 'excel', 'csv', 'parquet', 'db']
+REPEAT = 3
+# 抓取阶段最多抓取的行数（抓取1M行要5万次请求，测吞吐不需要这么多）
+FETCH_ROWS = 20000
+FETCH_WORKERS = 8
+QS_PAGE_SIZE = 30
+CHUNK_SIZE = 5000
+
+
+@contextmanager
+def patched(module, **values):
+    """临时替换模块级配置（接口地址、限速参数等），退出时恢复"""
+    saved = {name: getattr(module, name) for name in values}
+    for name, value in values.items():
+        setattr(module, name, value)
+    try:
+        yield module
+    finally:
+        for name, value in saved.items():
+            setattr(module, name, value)
+
+
+def fund_pages(rows, page_size):
+    """合成的基金从业人员分页数据，逐页产出"""
+    for page in range(-(-rows // page_size)):
+        yield page, mock_server.fund_page(page, page_size, rows)
+
+
+def fund_chunks(rows, chunk_size=CHUNK_SIZE):
+    """规范化后的块，供excel/parquet/db阶段共用"""
+    import fund_crawler
+    return [df for _, df in fund_crawler.iter_chunks(fund_pages(rows, fund_crawler.PAGE_SIZE), chunk_size)]
+
+
+def bench_fetch_qs(rows, context):
+    import QStop
+    rows = min(rows, context['fetch_rows'])
+    with mock_server.MockServer(qs_rows=rows, **context['server']) as server, \
+            patched(QStop, API_URL=server.qs_url, HTTP_CACHE=False):
+        session = QStop.get_session()
+        try:
+            start = time.perf_counter()
+            df = QStop.fetch_all_concurrent(session, max_workers=FETCH_WORKERS, rate=10000)
+            seconds = time.perf_counter() - start
+        finally:
+            session.close()
+    return len(df), seconds
+
+
+def bench_fetch_fund(rows, context):
+    import fund_crawler
+    rows = min(rows, context['fetch_rows'])
+    rate_limit = {'initial_rate': 10000, 'min_rate': 10000, 'max_rate': 10000}
+    with mock_server.MockServer(fund_rows=rows, **context['server']) as server, \
+            patched(fund_crawler, API_URL=server.fund_url, HTTP_CACHE=False, RATE_LIMIT=rate_limit):
+        start = time.perf_counter()
+        fetched = sum(len(content) for _, content in fund_crawler.iter_pages(max_records=rows,
+                                                                              max_in_flight=FETCH_WORKERS))
+        seconds = time.perf_counter() - start
+    return fetched, seconds
+
+
+def bench_parse(rows, context):
+    from qs_parser import parse_score_nodes
+    parsed = 0
+    seconds = 0.0
+    for page in range(-(-rows // QS_PAGE_SIZE)):
+        nodes = mock_server.qs_page(page, QS_PAGE_SIZE, rows)
+        start = time.perf_counter()
+        df, rejected = parse_score_nodes(nodes)
+        seconds += time.perf_counter() - start
+        parsed += len(df) + rejected
+    return parsed, seconds
+
+
+def bench_normalize(rows, context):
+    import fund_crawler
+    import pandas as pd
+    crawl_time = pd.Timestamp.now().floor('s')
+    normalized = 0
+    seconds = 0.0
+    records = [record for _, content in fund_pages(rows, fund_crawler.PAGE_SIZE) for record in content]
+    for i in range(0, len(records), CHUNK_SIZE):
+        start = time.perf_counter()
+        df = fund_crawler.normalize_records(records[i:i + CHUNK_SIZE], crawl_time)
+        seconds += time.perf_counter() - start
+        normalized += len(df)
+    return normalized, seconds
+
+
+def bench_export(rows, context, ext):
+    from sinks import open_sink
+    chunks = context['chunks'](rows)
+    path = os.path.join(context['tmpdir'], f'bench_{rows}{ext}')
+    try:
+        sink = open_sink(path)
+    except ImportError:
+        return None
+    start = time.perf_counter()
+    for df in chunks:
+        sink.write(df)
+    sink.close()
+    seconds = time.perf_counter() - start
+    os.remove(path)
+    return sum(len(df) for df in chunks), seconds
+
+
+def bench_db(rows, context):
+    import fund_crawler
+    import storage
+    from sqlalchemy import text
+    chunks = context['chunks'](rows)
+    path = os.path.join(context['tmpdir'], f'bench_{rows}.sqlite')
+    engine = storage.create_engine('sqlite', path=path)
+    sink = fund_crawler.FundPersonnelDbSink(engine, crawl_date=date.today(), incremental=False)
+    start = time.perf_counter()
+    for _ in range(2):
+        for df in chunks:
+            sink.write(df)
+    seconds = time.perf_counter() - start
+    with engine.connect() as conn:
+        stored = conn.execute(text('SELECT COUNT(*) FROM fund_personnel')).scalar()
+    engine.dispose()
+    if stored != sum(len(df) for df in chunks):
+        raise RuntimeError('SQLite upsert 行数不一致')
+    return sink.rows, seconds
+
+
+BENCHMARKS = {
+    'fetch_qs': bench_fetch_qs,
+    'fetch_fund': bench_fetch_fund,
+    'parse': bench_parse,
+    'normalize': bench_normalize,
+    'excel': partial(bench_export, ext='.xlsx'),
+    'csv': partial(bench_export, ext='.csv'),
+    'parquet': partial(bench_export, ext='.parquet'),
+    'db': bench_db
+}
+
+
+def run(sizes=SIZES, stages=STAGES, repeat=REPEAT, fetch_rows=FETCH_ROWS, latency=0.0, error_rate=0.0):
+    """运行基准测试，返回结果列表；每项取repeat次中耗时的中位数"""
+    cached = {}
+
+    def chunks(rows):
+        # 同一规模的规范化数据只生成一次
+        if rows not in cached:
+            cached.clear()
+            cached[rows] = fund_chunks(rows)
+        return cached[rows]
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='qs_bench_') as tmpdir:
+        context = {
+            'tmpdir': tmpdir,
+            'chunks': chunks,
+            'fetch_rows': fetch_rows,
+            'server': {'latency': latency, 'error_rate': error_rate}
+        }
+        for rows in sizes:
+            for stage in stages:
+                samples = []
+                for _ in range(repeat):
+                    outcome = BENCHMARKS[stage](rows, context)
+                    if outcome is None:
+                        break
+                    samples.append(outcome)
+                if not samples:
+                    print(f"{stage:<11}{rows:>9}  跳过（缺少依赖）")
+                    continue
+                handled = samples[0][0]
+                seconds = statistics.median(seconds for _, seconds in samples)
+                result = {
+                    'stage': stage,
+                    'size': rows,
+                    'rows': handled,
+                    'seconds': seconds,
+                    'rows_per_sec': handled / seconds if seconds > 0 else None,
+                    # 当前常驻内存；进程峰值包含之前跑过的所有阶段和规模，只作参考
+                    'rss_bytes': run_metrics.current_rss_bytes(),
+                    'process_peak_rss_bytes': run_metrics.process_peak_rss_bytes()
+                }
+                results.append(result)
+                print(f"{stage:<11}{rows:>9}{handled:>10} 行 {seconds:>9.3f} 秒 "
+                      f"{result['rows_per_sec'] or 0:>12,.0f} 行/秒")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线基准测试各阶段吞吐')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='数据规模（行数），如 1000 100000 1000000')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='每项重复次数，取中位数')
+    parser.add_argument('--fetch-rows', type=int, default=FETCH_ROWS, help='抓取阶段最多抓取的行数')
+    parser.add_argument('--latency', type=float, default=0.0, help='模拟接口每个响应的延迟（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='模拟接口随机返回429/5xx的概率')
+    parser.add_argument('--json', help='结果另存为JSON文件')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.stages, args.repeat, args.fetch_rows, args.latency, args.error_rate)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
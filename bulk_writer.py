@@ -0,0 +1,42 @@
+"""批量写库：分块多行 INSERT ... ON DUPLICATE KEY UPDATE
+
+每块一条多行语句、一个事务，替代逐行 iterrows + 单条 upsert 的写法。
+SQLite等其他后端的写法见 storage.py，bulk_upsert 按引擎自动选择。
+"""
+import pandas as pd
+
+BATCH_SIZE = 1000
+
+
+def build_upsert_sql(table, columns, update_columns, row_count):
+    """生成 row_count 行的多行upsert语句，参数名形如 :col_0, :col_1 ..."""
+    column_sql = ', '.join(f'`{col}`' for col in columns)
+    values_sql = ', '.join(
+        '(' + ', '.join(f':{col}_{i}' for col in columns) + ')'
+        for i in range(row_count)
+    )
+    sql = f"INSERT INTO {table} ({column_sql}) VALUES {values_sql}"
+    if update_columns:
+        update_sql = ', '.join(f'`{col}` = VALUES(`{col}`)' for col in update_columns)
+        sql += f" ON DUPLICATE KEY UPDATE {update_sql}"
+    return sql
+
+
+def iter_rows(df, columns):
+    """按列取出DataFrame的行元组，NaN/NaT转为None，日期时间列转为字符串"""
+    frame = df[list(columns)].copy()
+    for col in frame.columns:
+        if pd.api.types.is_datetime64_any_dtype(frame[col]):
+            frame[col] = frame[col].dt.strftime('%Y-%m-%d %H:%M:%S')
+    frame = frame.astype(object)
+    frame = frame.where(frame.notna(), None)
+    return frame.itertuples(index=False, name=None)
+
+
+def bulk_upsert(engine, table, df, columns=None, update_columns=(), batch_size=BATCH_SIZE):
+    """分块写入DataFrame，每块一个事务，返回 {'rows', 'seconds', 'rows_per_sec'}
+
+    按引擎选择存储后端（storage.py）：MySQL为多行upsert语句，SQLite为单行upsert分批executemany。
+    """
+    from storage import backend_for
+    return backend_for(engine).upsert(table, df, columns, update_columns, batch_size)
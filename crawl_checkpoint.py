@@ -0,0 +1,140 @@
+"""爬取断点：记录已提交的页、总页数和部分输出位置，进程重启后从断点继续
+
+状态保存在 state/<爬虫>.json（原子替换写入），已提交页的数据同时追加到
+state/<爬虫>_partial.pkl（每次提交追加一个pickle的DataFrame，读回时列类型、空串、时间都不变），
+续爬时据此补全Excel等需要完整数据的输出。
+爬取完整结束后断点文件被删除；超过 max_age 没有进展（距最近一次提交）的旧断点视为作废。
+"""
+import json
+import os
+import pickle
+import threading
+from datetime import datetime, date
+
+
+STATE_DIR = 'state'
+
+
+class CrawlCheckpoint:
+    """单个爬虫的断点状态，线程安全（后台写入线程会调用 commit）"""
+
+    def __init__(self, name, max_age=36 * 3600, directory=STATE_DIR):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = os.path.join(directory, f'{name}.json')
+        self.lock = threading.Lock()
+        self.state = self._load(max_age)
+        self.resumed = self.state is not None
+        if self.state is None:
+            self.state = {
+                'crawl_date': date.today().isoformat(),
+                'started_at': datetime.now().isoformat(timespec='seconds'),
+                'committed_through': -1,
+                'committed_extra': [],
+                'last_page': None,
+                'partial_path': os.path.join(directory, f'{name}_partial.pkl'),
+                'partial_rows': 0
+            }
+            if os.path.exists(self.partial_path):
+                os.remove(self.partial_path)
+        self.committed = set(range(self.state['committed_through'] + 1)) | set(self.state['committed_extra'])
+
+    def _load(self, max_age):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                state = json.load(f)
+            # 按最近一次进展计算断点年龄：每天的运行时限内抓不完的爬取可以连续多天续爬直到完整
+            progressed_at = datetime.fromisoformat(state.get('updated_at') or state['started_at'])
+        except (ValueError, KeyError):
+            return None
+        if not state.get('partial_path', '').endswith('.pkl'):
+            # 旧版本的CSV部分输出读回时类型不可靠，这样的断点作废
+            return None
+        if (datetime.now() - progressed_at).total_seconds() > max_age:
+            return None
+        return state
+
+    @property
+    def crawl_date(self):
+        """续爬沿用首次运行的爬取日期，保证同一轮数据日期一致"""
+        return date.fromisoformat(self.state['crawl_date'])
+
+    @property
+    def partial_path(self):
+        return self.state['partial_path']
+
+    @property
+    def partial_rows(self):
+        return self.state['partial_rows']
+
+    @property
+    def committed_through(self):
+        """从第0页起连续提交到的页号，-1表示还没有"""
+        return self.state['committed_through']
+
+    @property
+    def last_page(self):
+        return self.state['last_page']
+
+    def is_committed(self, page):
+        return page in self.committed
+
+    def set_last_page(self, last_page):
+        """记录总页数（页号范围为 0..last_page-1）"""
+        with self.lock:
+            if self.state['last_page'] != last_page:
+                self.state['last_page'] = last_page
+                self._save()
+
+    def commit(self, pages, df=None):
+        """数据写入成功后调用：标记这些页已提交，并把数据追加到部分输出文件"""
+        with self.lock:
+            if df is not None and len(df):
+                with open(self.partial_path, 'ab') as f:
+                    pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+                self.state['partial_rows'] += len(df)
+            self.committed.update(pages)
+            through = self.state['committed_through']
+            while through + 1 in self.committed:
+                through += 1
+            self.state['committed_through'] = through
+            self.state['committed_extra'] = sorted(p for p in self.committed if p > through)
+            self._save()
+
+    def iter_partial(self):
+        """按提交的批次读出之前运行已提交的数据"""
+        if not os.path.exists(self.partial_path):
+            return
+        with open(self.partial_path, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except (EOFError, pickle.UnpicklingError):
+                    # 文件结尾，或进程在追加时退出留下的不完整记录（该批次未计入断点）
+                    return
+
+    def is_complete(self, pages=()):
+        """所有页都已提交；pages为本次已抓到但未提交的页时，判断的是抓取是否完整"""
+        last_page = self.state['last_page']
+        if last_page is None:
+            return False
+        if not pages:
+            return self.state['committed_through'] >= last_page - 1
+        covered = self.committed | set(pages)
+        return all(page in covered for page in range(last_page))
+
+    def finish(self):
+        """爬取完整结束，删除断点和部分输出文件"""
+        with self.lock:
+            for path in (self.path, self.partial_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _save(self):
+        self.state['updated_at'] = datetime.now().isoformat(timespec='seconds')
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
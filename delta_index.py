@@ -0,0 +1,93 @@
+"""增量写库：按业务键维护可变字段的哈希索引，只写入新增或内容有变化的记录
+
+索引是 业务键 -> 64位哈希 的Series，每次运行加载一次（本地文件不存在、或条数与表中记录数
+不一致时由调用方从数据库重建），写库成功后并入本次的新哈希，运行结束时保存。
+"""
+import os
+
+import pandas as pd
+
+
+def canonical_frame(df, columns):
+    """把待哈希的列统一转成字符串，保证爬取数据和从数据库读回的数据哈希一致"""
+    frame = pd.DataFrame(index=df.index)
+    for col in columns:
+        values = df[col]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            frame[col] = values.dt.strftime('%Y-%m-%d %H:%M:%S').fillna('')
+        elif pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            frame[col] = pd.to_numeric(values, errors='coerce').fillna(0).astype('int64').astype(str)
+        else:
+            frame[col] = values.astype(object).where(values.notna(), '').astype(str)
+    return frame
+
+
+def record_hashes(df, key, columns):
+    """整块计算每条记录可变字段的哈希，返回以业务键为索引的uint64 Series"""
+    hashes = pd.util.hash_pandas_object(canonical_frame(df, columns), index=False)
+    return pd.Series(hashes.to_numpy(), index=df[key].astype(str).to_numpy(), name='hash')
+
+
+class DeltaIndex:
+    """业务键 -> 内容哈希 的索引，用于筛出新增/变化的记录"""
+
+    def __init__(self, key, columns, path):
+        self.key = key
+        self.columns = list(columns)
+        self.path = path
+        self.hashes = pd.Series(dtype='uint64', name='hash')
+        self.pending = []
+        self.stats = {'added': 0, 'changed': 0, 'unchanged': 0}
+        self.rebuilt = False
+
+    def load(self, rebuild=None, rows=None):
+        """加载本地索引；文件不存在，或给出了表中记录数rows而与索引条数不一致时，
+        调用 rebuild() 产出的DataFrame块重建"""
+        if os.path.exists(self.path):
+            hashes = pd.read_pickle(self.path)
+            hashes = hashes[~hashes.index.duplicated(keep='last')]
+            if rows is None or len(hashes) == rows:
+                self.hashes = hashes
+                return self
+        if rebuild is not None:
+            parts = [record_hashes(chunk, self.key, self.columns) for chunk in rebuild()]
+            if parts:
+                self.hashes = pd.concat(parts)
+                self.hashes = self.hashes[~self.hashes.index.duplicated(keep='last')]
+            self.rebuilt = True
+        return self
+
+    def diff(self, df):
+        """返回 (需要写入的行, 这些行的新哈希)，并累计新增/变化/未变化计数"""
+        new = record_hashes(df, self.key, self.columns)
+        # 用位置查找而不是reindex，避免缺失值把uint64转成float丢失精度
+        positions = self.hashes.index.get_indexer(new.index)
+        added = positions == -1
+        changed = ~added
+        if changed.any():
+            changed &= self.hashes.to_numpy()[positions] != new.to_numpy()
+        write = added | changed
+
+        self.stats['added'] += int(added.sum())
+        self.stats['changed'] += int(changed.sum())
+        self.stats['unchanged'] += int((~write).sum())
+        return df[write], new[write]
+
+    def update(self, hashes):
+        """记录已成功写库的新哈希，save() 时并入索引"""
+        if len(hashes):
+            self.pending.append(hashes)
+
+    def save(self):
+        # 重建过的索引即使本次没有写入也要保存，下次运行不必再重建
+        if not self.pending and not self.rebuilt:
+            return
+        self.hashes = pd.concat([self.hashes, *self.pending])
+        self.hashes = self.hashes[~self.hashes.index.duplicated(keep='last')]
+        self.pending = []
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = self.path + '.tmp'
+        self.hashes.to_pickle(tmp_path)
+        os.replace(tmp_path, self.path)
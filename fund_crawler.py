@@ -1,14 +1,23 @@
+"""基金从业资格人员爬虫
+
+作为模块导入时没有副作用：日志在 main() 中配置，pandas、SQLAlchemy、openpyxl
+在用到的阶段才导入，调度器和其他工具可以直接导入本模块调用 run_pipeline。
+"""
 import requests
-import pandas as pd
+import os
+import sys
 import random
 import time
 import logging
-from datetime import datetime, date
-from sqlalchemy import create_engine, text
-import urllib3
-
-# 禁用SSL警告
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date
+from rate_limiter import AdaptiveRateLimiter
+from http_cache import ResponseCache, is_cached
+from http_transport import create_session, backoff_delay
+from response_archive import ResponseArchive
+import run_metrics
+from storage import Column, Table
 
 # 配置
 DB_CONFIG = {
@@ -18,9 +27,89 @@ DB_CONFIG = {
     'password': '123456',
     'database': 'qs_data'
 }
+DB_BACKEND = 'mysql'     # 数据库后端：'mysql' / 'sqlite'（不需要数据库服务，见storage.py）
+SQLITE_PATH = 'data/fund_crawler.sqlite'
+
+# 抓取配置
+API_URL = "https://gs.amac.org.cn/amac-infodisc/api/pof/person"
+PAGE_SIZE = 20
+MAX_IN_FLIGHT = 4      # 同时在途的分页请求数
+PAGE_RETRIES = 3       # 单页最多尝试次数
+RATE_LIMIT = {         # 自适应限速参数（次/秒）
+    'initial_rate': 2.0,
+    'min_rate': 0.2,
+    'max_rate': 10.0
+}
+DB_BATCH_SIZE = 1000   # 每批upsert的行数（一批一个事务）
+CHUNK_SIZE = 5000      # 流水线每块记录数，决定内存上限
+MAX_RECORDS = None     # 最多爬取的记录数，None表示全部
+BACKGROUND_WRITE = True  # 后台线程写库/写文件，与抓取重叠进行
+WRITE_QUEUE_SIZE = 4     # 后台写入队列长度（块数），写入跟不上时抓取会被阻塞
+HTTP_CACHE = True        # 本地响应缓存，开发调试重跑时直接读磁盘
+HTTP_CACHE_PATH = 'cache/fund_http_cache.sqlite'
+HTTP_CACHE_TTL = 12 * 3600
+ARCHIVE_RESPONSES = True # 把原始响应归档到archive/，可用reparse.py离线重新解析
+EXPORT_FORMAT = 'xlsx'   # 导出文件格式：'xlsx' / 'csv' / 'parquet'（parquet需要pyarrow）
+CHECKPOINT = True        # 记录已入库的页到state/，中断后重跑从断点继续
+CHECKPOINT_MAX_AGE = 36 * 3600  # 超过该时长没有进展的断点作废（大于每日调度间隔，次日运行总是续爬）
+INCREMENTAL = True       # 增量写库：只写入新增或可变字段有变化的证书
+DELTA_INDEX_PATH = 'state/fund_personnel_hashes_{database}.pkl'  # cert_code -> 可变字段哈希，按数据库区分，删除后从数据库重建
+CHANGE_FEED = True       # 与上次完整爬取比较，输出证书状态/机构变化事件到changes/
+CHANGE_FIELDS = ['status_name', 'org_name', 'cert_name', 'credit_record_num']
+
+# 接口字段 -> 输出列
+FIELD_MAP = {
+    'userName': 'name',
+    'sex': 'gender',
+    'certCode': 'cert_code',
+    'orgName': 'org_name',
+    'certName': 'cert_name',
+    'certObtainDate': 'cert_obtain_date',
+    'certStatusChangeTimes': 'cert_status_change_times',
+    'creditRecordNum': 'credit_record_num',
+    'statusName': 'status_name',
+    'educationName': 'education_name'
+}
+STRING_COLUMNS = ['name', 'gender', 'cert_code', 'org_name', 'cert_name', 'status_name', 'education_name']
+INT_COLUMNS = ['cert_status_change_times', 'credit_record_num']
+CATEGORY_COLUMNS = ['gender', 'cert_name', 'status_name', 'education_name', 'org_name']
+
+# 参与增量比较的可变字段（crawl_date/crawl_time每次都变，不参与）
+MUTABLE_COLUMNS = ['name', 'gender', 'org_name', 'cert_name', 'cert_obtain_date',
+                   'cert_status_change_times', 'credit_record_num', 'status_name', 'education_name']
+
+DB_COLUMNS = ['name', 'gender', 'cert_code', 'org_name', 'cert_name', 'cert_obtain_date',
+              'cert_status_change_times', 'credit_record_num', 'status_name', 'education_name',
+              'crawl_date', 'crawl_time']
+
+FUND_PERSONNEL = Table(
+    'fund_personnel',
+    [
+        Column('id', 'int', nullable=False, auto_increment=True),
+        Column('name', 'varchar(100)', nullable=False, comment='姓名'),
+        Column('gender', 'varchar(10)', comment='性别'),
+        Column('cert_code', 'varchar(100)', nullable=False, comment='证书编号'),
+        Column('org_name', 'varchar(255)', comment='机构名称'),
+        Column('cert_name', 'varchar(255)', comment='从业资格类别'),
+        Column('cert_obtain_date', 'datetime', comment='证书取得日期'),
+        Column('cert_status_change_times', 'int', comment='证书状态变更记录'),
+        Column('credit_record_num', 'int', comment='诚信记录'),
+        Column('status_name', 'varchar(100)', comment='证书状态'),
+        Column('education_name', 'varchar(100)', comment='学历'),
+        Column('crawl_date', 'date', nullable=False, comment='爬取日期'),
+        Column('crawl_time', 'datetime', comment='爬取时间'),
+        Column('create_time', 'datetime', nullable=False, default='CURRENT_TIMESTAMP', comment='创建时间')
+    ],
+    primary_key=['id'],
+    unique={'cert_code': ['cert_code'], 'uk_cert_code_date': ['cert_code', 'crawl_date']},
+    comment='基金从业资格人员信息表'
+)
 
 def setup_logging():
     """设置日志"""
+    if not os.path.exists('logs'):
+        os.makedirs('logs')
+    
     logging.basicConfig(
         level=logging.INFO,
         format='%(asctime)s | %(levelname)s | %(message)s',
@@ -31,205 +120,524 @@ def setup_logging():
     )
     return logging.getLogger(__name__)
 
-logger = setup_logging()
+logger = logging.getLogger(__name__)
 
-def get_session():
-    """创建会话"""
-    session = requests.Session()
-    session.verify = False
-    session.headers.update({
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36',
+def get_session(archive=None):
+    """创建会话（共享传输层，连接池大小等于在途请求数），传入archive时记录收到的每个原始响应
+    （复用会话时由iter_pages按次挂上/取下）"""
+    cache = ResponseCache(HTTP_CACHE_PATH, ttl=HTTP_CACHE_TTL) if HTTP_CACHE else None
+    return create_session(MAX_IN_FLIGHT, {
         'Accept': 'application/json, text/javascript, */*; q=0.01',
-        'Accept-Language': 'zh-CN,zh;q=0.9',
         'Content-Type': 'application/json',
         'Origin': 'https://gs.amac.org.cn',
         'Referer': 'https://gs.amac.org.cn/amac-infodisc/res/pof/person/personList.html?userId=1700000000699008',
         'X-Requested-With': 'XMLHttpRequest'
-    })
-    return session
+    }, cache, archive)
+
+_local_tz = None
 
-def convert_timestamp(timestamp):
-    """转换时间戳"""
-    if timestamp:
+def local_timezone():
+    """本机时区：能确定IANA名称（TZ环境变量或/etc/localtime）时用ZoneInfo，pandas可整列换算；
+    否则用dateutil的tzlocal（逐条换算，较慢）"""
+    global _local_tz
+    if _local_tz is None:
+        from zoneinfo import ZoneInfo
+        from dateutil.tz import tzlocal
+        name = os.environ.get('TZ', '').lstrip(':')
+        if not name and os.path.islink('/etc/localtime'):
+            name = os.path.realpath('/etc/localtime').partition('zoneinfo/')[2]
         try:
-            return datetime.fromtimestamp(timestamp / 1000).strftime('%Y-%m-%d %H:%M:%S')
-        except:
-            return None
-    return None
-
-def crawl_fund_data():
-    """爬取基金从业资格数据"""
-    session = get_session()
-    all_personnel = []
-    page = 0
-    page_size = 20
-    max_records = 1000  # 只爬取1000条数据
-    
-    logger.info("开始爬取基金从业资格数据")
-    
-    while len(all_personnel) < max_records:
+            _local_tz = ZoneInfo(name) if name else tzlocal()
+        except (ValueError, OSError):
+            _local_tz = tzlocal()
+    return _local_tz
+
+def normalize_records(records, crawl_time):
+    """整块向量化规范化：字段重命名、时间戳整列转换、低基数列转为分类类型
+    
+    pandas每次调用有固定开销，应整块（CHUNK_SIZE条）调用，不要逐页调用。
+    """
+    import pandas as pd
+    df = pd.DataFrame.from_records(records).reindex(columns=list(FIELD_MAP)).rename(columns=FIELD_MAP)
+    
+    for col in STRING_COLUMNS:
+        df[col] = df[col].fillna('').astype(str)
+    for col in INT_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype('int32')
+    
+    # 毫秒时间戳按本机时区逐条换算（与原datetime.fromtimestamp一致，夏令时前后也正确），0或空值视为无日期
+    timestamps = pd.to_numeric(df['cert_obtain_date'], errors='coerce')
+    df['cert_obtain_date'] = (pd.to_datetime(timestamps.where(timestamps != 0), unit='ms')
+                              .dt.tz_localize('UTC').dt.tz_convert(local_timezone()).dt.tz_localize(None))
+    
+    df['crawl_time'] = crawl_time
+    df[CATEGORY_COLUMNS] = df[CATEGORY_COLUMNS].astype('category')
+    return df
+
+def fetch_page(session, page, limiter, page_size=PAGE_SIZE, retries=PAGE_RETRIES):
+    """请求单页数据，发送节奏由限速器控制，失败时指数退避（加抖动）后重试，返回接口JSON"""
+    json_data = {
+        'userId': '1700000000699008',
+        'page': 1
+    }
+    metrics = run_metrics.get('fund_crawler')
+    for attempt in range(1, retries + 1):
+        if attempt > 1:
+            metrics.count('retries')
+            time.sleep(backoff_delay(attempt - 1))
+        params = {
+            'rand': f"0.{random.randint(1000000000000000, 9999999999999999)}",
+            'page': page,
+            'size': page_size
+        }
+        # 命中缓存的请求不占用限速配额
+        throttled = not is_cached(session, 'POST', API_URL, params=params, json=json_data)
+        if throttled:
+            limiter.acquire()
+        start = time.monotonic()
         try:
-            # 请求参数
-            params = {
-                'rand': f"0.{random.randint(1000000000000000, 9999999999999999)}",
-                'page': page,
-                'size': page_size
-            }
-            json_data = {
-                'userId': '1700000000699008',
-                'page': 1
-            }
-            
-            # 发送请求
-            response = session.post(
-                "https://gs.amac.org.cn/amac-infodisc/api/pof/person",
-                params=params,
-                json=json_data,
-                timeout=30
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"请求失败: {response.status_code}")
-                break
-                
-            data = response.json()
-            content = data.get('content', [])
-            
-            if not content:
-                logger.info("没有更多数据")
+            with metrics.profile('fetch'):
+                response = session.post(API_URL, params=params, json=json_data)
+        except requests.exceptions.RequestException as e:
+            limiter.on_error()
+            metrics.count('errors')
+            logger.warning(f"第{page+1}页请求异常(第{attempt}次): {e}")
+            continue
+        
+        if throttled:
+            limiter.on_response(response.status_code, time.monotonic() - start)
+        if response.status_code == 200:
+            return response.json()
+        logger.warning(f"第{page+1}页请求失败(第{attempt}次): {response.status_code}")
+    
+    raise RuntimeError(f"第{page+1}页请求失败，已尝试{retries}次")
+
+def iter_pages(max_records=None, max_in_flight=MAX_IN_FLIGHT, archive=None, checkpoint=None,
+               session=None, deadline=None):
+    """分页生成器：多个分页请求并行，按完成顺序逐页产出 (页号, content)
+    
+    传入checkpoint时跳过已提交的页，并记录总页数供判断爬取是否完整。
+    传入session时复用该会话（调度器跨次保持的长连接），用完不关闭；
+    deadline为time.monotonic()时刻，到点后不再发出新请求，已在途的页照常产出。
+    """
+    own_session = session is None
+    session = session or get_session()
+    if archive:
+        archive.attach(session)
+    metrics = run_metrics.get('fund_crawler').attach(session)
+    limiter = AdaptiveRateLimiter(**RATE_LIMIT)
+    
+    def committed(page):
+        return checkpoint is not None and checkpoint.is_committed(page)
+    
+    executor = ThreadPoolExecutor(max_workers=max_in_flight)
+    pending = {}
+    try:
+        try:
+            first = fetch_page(session, 0, limiter)
+        except Exception as e:
+            logger.error(f"爬取异常: {e}")
+            return
+        
+        content = first.get('content', [])
+        if not content:
+            logger.info("没有更多数据")
+            if checkpoint:
+                checkpoint.set_last_page(0)
+            return
+        if not committed(0):
+            logger.info(f"第1页: {len(content)}条数据")
+            metrics.add_rows('fetch', len(content))
+            yield 0, content
+        
+        # 根据总页数和记录上限确定要抓取的页；接口未返回总页数时抓到空页为止
+        last_page = first.get('totalPages') or float('inf')
+        if max_records:
+            last_page = min(last_page, -(-max_records // PAGE_SIZE))
+        if checkpoint and last_page != float('inf'):
+            checkpoint.set_last_page(last_page)
+        
+        next_page = 1
+        stopped = False
+        while True:
+            if not stopped and deadline is not None and time.monotonic() > deadline:
+                logger.warning(f"已到运行时限，停止发出新请求（下一页: 第{next_page+1}页）")
+                stopped = True
+            while not stopped and len(pending) < max_in_flight and next_page < last_page:
+                if not committed(next_page):
+                    pending[executor.submit(fetch_page, session, next_page, limiter)] = next_page
+                next_page += 1
+            if not pending:
                 break
             
-            # 处理数据
-            for person in content:
-                cert_obtain_date = convert_timestamp(person.get('certObtainDate'))
-                
-                personnel_info = {
-                    'name': person.get('userName', ''),
-                    'gender': person.get('sex', ''),
-                    'cert_code': person.get('certCode', ''),
-                    'org_name': person.get('orgName', ''),
-                    'cert_name': person.get('certName', ''),
-                    'cert_obtain_date': cert_obtain_date,
-                    'cert_status_change_times': person.get('certStatusChangeTimes', 0),
-                    'credit_record_num': person.get('creditRecordNum', 0),
-                    'status_name': person.get('statusName', ''),
-                    'education_name': person.get('educationName', ''),
-                    'crawl_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
-                all_personnel.append(personnel_info)
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                page = pending.pop(future)
+                try:
+                    content = future.result().get('content', [])
+                except Exception as e:
+                    logger.error(f"爬取异常: {e}")
+                    stopped = True
+                    continue
                 
-                # 达到1000条就停止
-                if len(all_personnel) >= max_records:
-                    break
-            
-            logger.info(f"第{page+1}页: {len(content)}条数据")
-            page += 1
-            time.sleep(random.uniform(1, 2))
-            
-        except Exception as e:
-            logger.error(f"爬取异常: {e}")
-            break
+                if not content:
+                    logger.info("没有更多数据")
+                    last_page = min(last_page, page)
+                    if checkpoint:
+                        checkpoint.set_last_page(last_page)
+                    continue
+                logger.info(f"第{page+1}页: {len(content)}条数据 (当前限速 {limiter.rate:.1f} 次/秒)")
+                metrics.add_rows('fetch', len(content))
+                yield page, content
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+        metrics.detach(session)
+        metrics.count('rate_limit_wait_seconds', limiter.waited)
+        if archive:
+            archive.detach(session)
+        if own_session:
+            session.close()
+
+def limit_pages(pages, max_records=None):
+    """截断到最多max_records条记录，None表示不限"""
+    if not max_records:
+        yield from pages
+        return
+    remaining = max_records
+    for page, content in pages:
+        if len(content) >= remaining:
+            yield page, content[:remaining]
+            return
+        remaining -= len(content)
+        yield page, content
+
+def concat_frames(frames):
+    """合并多块数据；各块的类别集合不同，合并后重新编码为分类类型"""
+    import pandas as pd
+    df = pd.concat(frames, ignore_index=True)
+    df[CATEGORY_COLUMNS] = df[CATEGORY_COLUMNS].astype('category')
+    return df
+
+def iter_chunks(pages, chunk_size=CHUNK_SIZE, crawl_time=None):
+    """把逐页原始记录攒到约chunk_size条后整块规范化，产出 (页号列表, DataFrame)；crawl_time整批只取一次"""
+    import pandas as pd
+    crawl_time = pd.Timestamp(crawl_time) if crawl_time else pd.Timestamp.now().floor('s')
+    metrics = run_metrics.get('fund_crawler')
     
-    logger.info(f"爬取完成: {len(all_personnel)}条数据")
-    return all_personnel
+    def flush():
+        with metrics.stage('normalize', rows=len(records)):
+            return page_numbers, normalize_records(records, crawl_time)
+    
+    page_numbers = []
+    records = []
+    for page, content in pages:
+        if not content:
+            continue
+        page_numbers.append(page)
+        records.extend(content)
+        if len(records) >= chunk_size:
+            yield flush()
+            page_numbers = []
+            records = []
+    if records:
+        yield flush()
+
+def crawl_fund_data(max_records=MAX_RECORDS, max_in_flight=MAX_IN_FLIGHT):
+    """爬取基金从业资格数据并一次性返回DataFrame（数据量大时请用 run_pipeline 流式处理）"""
+    import pandas as pd
+    frames = [df for _, df in iter_chunks(limit_pages(iter_pages(max_records, max_in_flight), max_records))]
+    if not frames:
+        return pd.DataFrame(columns=[*FIELD_MAP.values(), 'crawl_time'])
+    return concat_frames(frames)
+
+_engine = None
+
+def get_engine():
+    """数据库连接（进程内只创建一次，调度器多次运行复用同一个连接池），后端由DB_BACKEND决定"""
+    global _engine
+    if _engine is None:
+        from storage import create_engine
+        if DB_BACKEND == 'sqlite':
+            _engine = create_engine('sqlite', path=SQLITE_PATH)
+        else:
+            _engine = create_engine(DB_BACKEND, DB_CONFIG, pool_pre_ping=True, pool_recycle=3600)
+    return _engine
+
+def create_table_if_not_exists(engine):
+    """创建数据表（建表语句按引擎对应的后端生成）"""
+    from storage import backend_for
+    backend_for(engine).create_table(FUND_PERSONNEL)
+
+def iter_latest_records(engine, chunk_size=100000):
+    """按块读出各证书的可变字段，用于重建增量索引（cert_code唯一，每个证书只有一行）"""
+    import pandas as pd
+    from sqlalchemy import text
+    sql = f"SELECT {', '.join(['cert_code', *MUTABLE_COLUMNS])} FROM fund_personnel"
+    with engine.connect() as conn:
+        yield from pd.read_sql(text(sql), conn, chunksize=chunk_size, parse_dates=['cert_obtain_date'])
+
+def delta_index_path(engine):
+    """增量索引文件路径：按后端和数据库区分，切换DB_BACKEND或指向另一个库时不会误用别的库的索引"""
+    import hashlib
+    url = engine.url
+    identity = url.render_as_string(hide_password=True)
+    database = os.path.splitext(os.path.basename(url.database or ''))[0]
+    digest = hashlib.md5(identity.encode('utf-8')).hexdigest()[:8]
+    return DELTA_INDEX_PATH.format(database=f'{url.get_backend_name()}_{database}_{digest}')
+
+def count_records(engine):
+    from sqlalchemy import text
+    with engine.connect() as conn:
+        return conn.execute(text('SELECT COUNT(*) FROM fund_personnel')).scalar()
+
+class FundPersonnelDbSink:
+    """数据库sink：逐块批量upsert到fund_personnel
+    
+    cert_code唯一，每个证书只有一行：crawl_date为首次入库日期（之后不再更新），
+    其他字段和crawl_time在每次写入时更新。incremental为True时只写入新增或可变字段
+    有变化的证书，未变化的证书不再每天重写一遍，其crawl_time停留在最近一次变化时。
+    """
+    
+    def __init__(self, engine=None, batch_size=DB_BATCH_SIZE, crawl_date=None, incremental=INCREMENTAL):
+        self.engine = engine or get_engine()
+        self.batch_size = batch_size
+        self.crawl_date = crawl_date or date.today()
+        self.rows = 0
+        self.seconds = 0.0
+        create_table_if_not_exists(self.engine)
+        self.index = None
+        self.index_path = delta_index_path(self.engine)
+        if incremental:
+            from delta_index import DeltaIndex
+            start = time.perf_counter()
+            # 表中记录数与索引条数不一致（恢复过表、上次写库后没保存索引等）时不信任本地索引，从数据库重建
+            self.index = DeltaIndex('cert_code', MUTABLE_COLUMNS, self.index_path).load(
+                rebuild=partial(iter_latest_records, self.engine), rows=count_records(self.engine))
+            source = '从数据库重建' if self.index.rebuilt else '加载'
+            logger.info(f"增量索引: {len(self.index.hashes)}个证书，{source}耗时 {time.perf_counter() - start:.2f} 秒")
+    
+    def write(self, df):
+        from bulk_writer import bulk_upsert
+        hashes = None
+        if self.index is not None:
+            df, hashes = self.index.diff(df)
+            if df.empty:
+                return
+        df = df.assign(crawl_date=self.crawl_date)
+        update_columns = [col for col in DB_COLUMNS if col not in ('cert_code', 'crawl_date')]
+        stats = bulk_upsert(self.engine, 'fund_personnel', df, DB_COLUMNS, update_columns,
+                            batch_size=self.batch_size)
+        self.rows += stats['rows']
+        self.seconds += stats['seconds']
+        if hashes is not None:
+            self.index.update(hashes)
+    
+    def close(self):
+        rate = self.rows / self.seconds if self.seconds > 0 else 0.0
+        logger.info(f"数据库保存成功: {self.rows}条数据，耗时 {self.seconds:.2f} 秒，{rate:.0f} 条/秒")
+        if self.index is not None:
+            self.index.save()
+            stats = self.index.stats
+            logger.info(f"增量写库: 新增 {stats['added']}，变化 {stats['changed']}，未变化 {stats['unchanged']}（未写入）")
+        elif self.rows and os.path.exists(self.index_path):
+            # 全量写入的内容可能与索引不一致（如从归档重写旧数据），删除索引，下次增量运行从数据库重建
+            os.remove(self.index_path)
+            logger.info("已全量写库，增量索引作废，下次增量运行时从数据库重建")
 
 def save_to_excel(data):
     """保存到Excel"""
-    if not data:
+    import pandas as pd
+    from sinks import ExcelStreamSink
+    if data is None or len(data) == 0:
         return
     
-    df = pd.DataFrame(data)
     current_date = date.today()
     filename = f"基金从业资格_{current_date}.xlsx"
     
-    df.to_excel(filename, index=False)
+    sink = ExcelStreamSink(filename)
+    sink.write(pd.DataFrame(data))
+    sink.close()
     logger.info(f"Excel保存成功: {filename}")
 
 def save_to_database(data):
     """保存到数据库"""
-    if not data:
+    import pandas as pd
+    if data is None or len(data) == 0:
         return
     
     try:
-        # 连接数据库
-        engine = create_engine(
-            f"mysql+pymysql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}?charset=utf8mb4"
-        )
-        
-        # 创建表
-        create_table_sql = """
-        CREATE TABLE IF NOT EXISTS fund_personnel (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            name VARCHAR(100) NOT NULL COMMENT '姓名',
-            gender VARCHAR(10) COMMENT '性别',
-            cert_code VARCHAR(100) UNIQUE NOT NULL COMMENT '证书编号',
-            org_name VARCHAR(255) COMMENT '机构名称',
-            cert_name VARCHAR(255) COMMENT '从业资格类别',
-            cert_obtain_date DATETIME COMMENT '证书取得日期',
-            cert_status_change_times INT COMMENT '证书状态变更记录',
-            credit_record_num INT COMMENT '诚信记录',
-            status_name VARCHAR(100) COMMENT '证书状态',
-            education_name VARCHAR(100) COMMENT '学历',
-            crawl_date DATE NOT NULL COMMENT '爬取日期',
-            crawl_time DATETIME COMMENT '爬取时间',
-            create_time DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
-            UNIQUE KEY uk_cert_code_date (cert_code, crawl_date)
-        ) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4 COMMENT = '基金从业资格人员信息表'
-        """
-        
-        with engine.connect() as conn:
-            conn.execute(text(create_table_sql))
-            conn.commit()
-        
-        # 保存数据（只保存最新1000条）
-        df = pd.DataFrame(data)
-        df_for_db = df.head(1000) if len(df) > 1000 else df
-        current_date = date.today()
-        
-        with engine.connect() as conn:
-            for _, row in df_for_db.iterrows():
-                sql = """
-                INSERT INTO fund_personnel
-                (name, gender, cert_code, org_name, cert_name, cert_obtain_date,
-                 cert_status_change_times, credit_record_num, status_name, education_name, crawl_date, crawl_time)
-                VALUES (:name, :gender, :cert_code, :org_name, :cert_name, :cert_obtain_date,
-                        :cert_status_change_times, :credit_record_num, :status_name, :education_name, :crawl_date, :crawl_time)
-                ON DUPLICATE KEY UPDATE
-                name = VALUES(name), gender = VALUES(gender), org_name = VALUES(org_name),
-                cert_name = VALUES(cert_name), cert_obtain_date = VALUES(cert_obtain_date),
-                cert_status_change_times = VALUES(cert_status_change_times), credit_record_num = VALUES(credit_record_num),
-                status_name = VALUES(status_name), education_name = VALUES(education_name), crawl_time = VALUES(crawl_time)
-                """
-                conn.execute(text(sql), {
-                    'name': row['name'], 'gender': row['gender'], 'cert_code': row['cert_code'],
-                    'org_name': row['org_name'], 'cert_name': row['cert_name'], 'cert_obtain_date': row['cert_obtain_date'],
-                    'cert_status_change_times': row['cert_status_change_times'], 'credit_record_num': row['credit_record_num'],
-                    'status_name': row['status_name'], 'education_name': row['education_name'],
-                    'crawl_date': current_date, 'crawl_time': row['crawl_time']
-                })
-            conn.commit()
-        
-        logger.info(f"数据库保存成功: {len(df_for_db)}条数据")
-        
+        sink = FundPersonnelDbSink()
+        sink.write(pd.DataFrame(data))
+        sink.close()
     except Exception as e:
         logger.error(f"数据库保存失败: {e}")
 
-def main():
+def run_pipeline(max_records=MAX_RECORDS, chunk_size=CHUNK_SIZE, pages=None,
+                 crawl_date=None, crawl_time=None, excel=True, database=True, session=None, deadline=None,
+                 profile=False, incremental=INCREMENTAL):
+    """流式流水线：分页生成器 -> 记录规范化 -> 按块写入导出文件（EXPORT_FORMAT）和数据库，返回记录数
+    
+    pages为None时在线抓取；reparse.py从归档重放时传入归档中的 (页号, 分页数据) 及原爬取时间。
+    在线抓取且开启CHECKPOINT时，每块入库成功后记录断点，中断后重跑跳过已入库的页。
+    session/deadline 传给分页生成器，供调度器复用会话和限制运行时长。
+    profile为True时按阶段做cProfile/tracemalloc剖析，报告写到logs/。
+    incremental为False时每条记录都写库（从归档重新解析时用，解析逻辑变了需要整体重写）。
+    数据库写入失败时其余输出照常完成，最后抛出RuntimeError，调度器据此把这次运行记为失败。
+    """
+    from background_writer import BackgroundWriter
+    from crawl_checkpoint import CrawlCheckpoint
+    from change_feed import ChangeFeed, summarize
+    
+    profiler = None
+    if profile:
+        from stage_profiler import StageProfiler
+        profiler = StageProfiler('fund_crawler')
+    metrics = run_metrics.start('fund_crawler', profiler=profiler)
+    checkpoint = None
+    if pages is None and CHECKPOINT and not max_records:
+        checkpoint = CrawlCheckpoint('fund_crawler', max_age=CHECKPOINT_MAX_AGE)
+        if checkpoint.resumed:
+            crawl_date = checkpoint.crawl_date
+            logger.info(f"从断点继续: 已提交至第{checkpoint.committed_through + 1}页，"
+                        f"之前已入库 {checkpoint.partial_rows} 条")
+    
+    current_date = crawl_date or date.today()
+    export_filename = f"基金从业资格_{current_date}.{EXPORT_FORMAT}"
+    sinks = {}
+    db_error = None
+    if excel:
+        from sinks import open_sink
+        try:
+            sinks['文件'] = metrics.wrap_sink('excel', open_sink(export_filename))
+        except (ImportError, ValueError) as e:
+            logger.error(f"文件保存失败: {e}")
+    if database:
+        try:
+            sinks['数据库'] = metrics.wrap_sink('db', FundPersonnelDbSink(crawl_date=current_date,
+                                                                  incremental=incremental))
+        except Exception as e:
+            logger.error(f"数据库保存失败: {e}")
+            db_error = e
+    if BACKGROUND_WRITE:
+        sinks = {name: BackgroundWriter(sink, max_queue=WRITE_QUEUE_SIZE, batch_rows=DB_BATCH_SIZE,
+                                        name=f'{name}-writer')
+                 for name, sink in sinks.items()}
+    
+    # 断点以数据库为准：数据库写入成功才提交；不写库时数据产出即提交
+    commit_sink = '数据库' if database else None
+    if checkpoint and database and commit_sink not in sinks:
+        checkpoint = None
+    committing = checkpoint is not None
+    
+    # 变化事件只在完整的在线爬取后输出，避免把没抓到的记录误报为删除
+    feed = None
+    if CHANGE_FEED and pages is None and not max_records:
+        feed = ChangeFeed('fund_crawler', 'cert_code', CHANGE_FIELDS)
+    
+    if checkpoint and ('文件' in sinks or feed):
+        # 之前运行已入库的数据只补进导出文件和变化比较，保证它们是完整的一轮
+        for chunk in checkpoint.iter_partial():
+            if '文件' in sinks:
+                sinks['文件'].write(chunk)
+            if feed:
+                feed.add(chunk)
+    
+    archive = None
+    if pages is None:
+        archive = ResponseArchive('fund_crawler') if ARCHIVE_RESPONSES else None
+        pages = iter_pages(max_records, archive=archive, checkpoint=checkpoint,
+                           session=session, deadline=deadline)
+    
+    start_time = time.time()
+    total = 0
+    fetched_pages = []
+    for page_numbers, chunk in iter_chunks(limit_pages(pages, max_records), chunk_size, crawl_time):
+        total += len(chunk)
+        fetched_pages.extend(page_numbers)
+        if feed:
+            feed.add(chunk)
+        commit = partial(checkpoint.commit, page_numbers, chunk) if committing else None
+        for name, sink in list(sinks.items()):
+            on_done = commit if name == commit_sink else None
+            try:
+                if isinstance(sink, BackgroundWriter):
+                    sink.write(chunk, on_done=on_done)
+                else:
+                    sink.write(chunk)
+                    if on_done:
+                        on_done()
+            except Exception as e:
+                logger.error(f"{name}保存失败: {e}")
+                del sinks[name]
+                if name == '数据库':
+                    db_error = e
+                if name == commit_sink:
+                    # 数据库写入失败后不再推进断点，下次从失败处重抓
+                    committing = False
+        if commit and commit_sink is None:
+            commit()
+    if archive:
+        # 达到记录上限提前结束时，先停掉分页生成器中在途的请求再关闭归档
+        pages.close()
+    
+    logger.info(f"爬取完成: {total}条数据，耗时 {time.time() - start_time:.1f} 秒")
+    for name, sink in sinks.items():
+        try:
+            sink.close()
+        except Exception as e:
+            logger.error(f"{name}保存失败: {e}")
+            if name == '数据库':
+                db_error = e
+            continue
+        if isinstance(sink, BackgroundWriter):
+            metrics.count(f'{sink.sink.stage}_backpressure_seconds', sink.blocked_seconds)
+            if sink.blocked_seconds > 1:
+                logger.info(f"{name}写入跟不上抓取，抓取因背压等待 {sink.blocked_seconds:.1f} 秒")
+        if name == '文件' and total:
+            logger.info(f"文件保存成功: {export_filename}")
+    if archive:
+        archive.close()
+        logger.info(f"原始响应已归档: {archive.path} ({archive.count}条)")
+    if feed and (checkpoint is None or checkpoint.is_complete(fetched_pages)):
+        events, path = feed.publish(current_date)
+        if path:
+            logger.info(f"变化事件: {summarize(events) or '无变化'}，已写入 {path}")
+    if checkpoint:
+        if checkpoint.is_complete():
+            checkpoint.finish()
+        else:
+            logger.warning(f"爬取未完成，已提交至第{checkpoint.committed_through + 1}页，"
+                           f"重新运行将从断点继续: {checkpoint.path}")
+    try:
+        prom_path, json_path = run_metrics.finish(metrics)
+        logger.info(f"运行指标: {json_path}，{prom_path}")
+    except OSError as e:
+        logger.error(f"运行指标写出失败: {e}")
+    if profiler:
+        logger.info(f"性能剖析报告: {profiler.write()}")
+    if db_error is not None:
+        raise RuntimeError(f"数据库保存失败: {db_error}") from db_error
+    return total
+
+def main(max_records=MAX_RECORDS, profile=False):
     """主函数"""
+    setup_logging()
     logger.info("=" * 50)
     
-    # 爬取数据
-    all_personnel = crawl_fund_data()
+    try:
+        total = run_pipeline(max_records, profile=profile)
+    except RuntimeError:
+        # 错误已记录，导出文件照常生成；以非零状态退出，外部调度可以感知
+        logger.info("=" * 50)
+        sys.exit(1)
     
-    if all_personnel:
-        # 保存数据
-        save_to_excel(all_personnel)
-        save_to_database(all_personnel)
-        
+    if total:
         # 输出结果
         current_date = date.today()
-        logger.info(f"基金从业资格爬取完成: {len(all_personnel)} 条数据")
-        logger.info(f"Excel文件: 基金从业资格_{current_date}.xlsx")
+        logger.info(f"基金从业资格爬取完成: {total} 条数据")
+        logger.info(f"导出文件: 基金从业资格_{current_date}.{EXPORT_FORMAT}")
         logger.info(f"数据库表: fund_personnel")
     else:
         logger.error("基金从业资格爬取失败")
@@ -237,4 +645,4 @@ def main():
     logger.info("=" * 50)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main(profile='--profile' in sys.argv)
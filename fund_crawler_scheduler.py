@@ -1,11 +1,38 @@
-import schedule
-import time
-import subprocess
-import sys
+import json
 import os
-from datetime import datetime
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import logging
 
+# 共享工作线程数，不同站点的爬虫并行运行
+POOL_SIZE = 3
+# 同一站点同时运行的任务数，QS_requests和QStop都访问topuniversities.com，依次运行
+HOST_CONCURRENCY = 1
+# 超过运行时限后再等待收尾的时间（秒），仍未结束则记录错误，该任务在结束前不会再次启动
+JOB_GRACE = 300
+# 空闲时最长的检查间隔（秒），任务结束或到达触发时刻时会提前唤醒
+POLL_INTERVAL = 60
+# 每个任务最近一次成功运行的时间，用于调度进程重启后判断是否错过了运行
+STATE_PATH = 'state/scheduler.json'
+
+# 任务配置
+# at: 每天的触发时刻；host: 访问的站点；priority: 越小越先分到空闲的工作线程
+# budget: 单次运行时限（秒），支持时限的任务到点后停止发出新请求，已抓到的数据正常入库
+# max_concurrency: 同一任务同时运行的上限，达到上限时本次触发跳过
+# jitter: 触发时刻后随机延后的最长秒数
+# catch_up: 调度进程停机期间错过的运行，若错过的触发时刻在catch_up秒以内，启动后立即补跑一次；0表示不补跑
+JOBS = {
+    'fund_crawler': {'at': ['07:00'], 'host': 'gs.amac.org.cn', 'priority': 1, 'budget': 2 * 3600,
+                     'max_concurrency': 1, 'jitter': 300, 'catch_up': 6 * 3600},
+    'qstop': {'at': ['07:00'], 'host': 'www.topuniversities.com', 'priority': 2, 'budget': 3600,
+              'max_concurrency': 1, 'jitter': 300, 'catch_up': 6 * 3600},
+    'qs_requests': {'at': ['07:00'], 'host': 'www.topuniversities.com', 'priority': 3, 'budget': 1800,
+                    'max_concurrency': 1, 'jitter': 300, 'catch_up': 0},
+}
+
 def setup_logging():
     """设置日志"""
     if not os.path.exists('logs'):
@@ -13,60 +40,270 @@ def setup_logging():
     
     logging.basicConfig(
         level=logging.INFO,
-        format='%(asctime)s | %(levelname)-8s | %(message)s',
+        format='%(asctime)s | %(levelname)-8s | %(threadName)s | %(message)s',
         handlers=[
             logging.FileHandler(f'logs/scheduler_{datetime.now().strftime("%Y%m%d")}.log', encoding='utf-8')
         ]
     )
     return logging.getLogger(__name__)
 
-logger = setup_logging()
+logger = logging.getLogger(__name__)
 
-def run_crawler():
-    """运行爬虫任务"""
-    try:
-        logger.info("开始执行基金从业资格爬虫定时任务")
-        
-        # 运行爬虫脚本
-        result = subprocess.run([sys.executable, 'fund_crawler_post.py'], 
-                              capture_output=True, text=True, encoding='utf-8')
-        
-        if result.returncode == 0:
-            logger.info("✅ 爬虫任务执行成功")
-        else:
-            logger.error("❌ 爬虫任务执行失败")
-            logger.error(f"错误: {result.stderr}")
-        
-    except Exception as e:
-        logger.error(f"定时任务执行异常: {e}")
+class ScheduledJob:
+    """定时任务：func(deadline) 在共享工作线程中执行，deadline 为 time.monotonic() 时刻"""
+    
+    def __init__(self, name, func, at, host=None, priority=10, budget=3600, max_concurrency=1,
+                 jitter=0, catch_up=0):
+        self.name = name
+        self.func = func
+        self.times = sorted(datetime.strptime(t, '%H:%M').time() for t in at)
+        self.host = host
+        self.priority = priority
+        self.budget = budget
+        self.max_concurrency = max_concurrency
+        self.jitter = jitter
+        self.catch_up = catch_up
+        self.running = 0
+        self.next_run = None
+    
+    def next_slot(self, after):
+        """after 之后的下一个触发时刻（不含随机延后）"""
+        return min(datetime.combine(after.date() + timedelta(days=days), t)
+                   for days in (0, 1) for t in self.times
+                   if datetime.combine(after.date() + timedelta(days=days), t) > after)
+    
+    def last_slot(self, now):
+        """now 及之前最近的一个触发时刻"""
+        return max(datetime.combine(now.date() - timedelta(days=days), t)
+                   for days in (0, 1) for t in self.times
+                   if datetime.combine(now.date() - timedelta(days=days), t) <= now)
+    
+    def schedule_next(self, after):
+        self.next_run = self.next_slot(after) + timedelta(seconds=random.uniform(0, self.jitter))
 
-def main():
-    """主函数"""
-    logger.info("基金从业资格爬虫定时任务启动")
-    logger.info("定时设置: 每天早上7:00执行")
+class Scheduler:
+    """多任务调度：到期任务按优先级分配到共享线程池，同一任务和同一站点分别限制并发"""
+    
+    def __init__(self, jobs, pool_size=POOL_SIZE, host_concurrency=HOST_CONCURRENCY,
+                 grace=JOB_GRACE, state_path=STATE_PATH):
+        self.jobs = list(jobs)
+        self.pool_size = pool_size
+        self.host_concurrency = host_concurrency
+        self.grace = grace
+        self.state_path = state_path
+        self.pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='job')
+        # 任务结束的回调可能在提交线程中同步执行，用可重入锁
+        self.lock = threading.RLock()
+        self.wakeup = threading.Event()
+        self.active = {}
+        self.overdue = set()
+        self.hosts = {}
+        self.state = self._load_state()
     
-    # 设置定时任务 - 每天早上7点执行
-    schedule.every().day.at("07:00").do(run_crawler)
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"调度状态文件读取失败，忽略: {e}")
+            return {}
     
-    # 如果当前时间在7点到8点之间，立即执行一次
-    current_hour = datetime.now().hour
-    if 7 <= current_hour < 8:
-        logger.info("当前时间在7-8点之间，立即执行一次爬虫任务")
-        run_crawler()
+    def _save_state(self):
+        directory = os.path.dirname(self.state_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
     
-    logger.info("定时任务已启动，等待执行...")
+    def start(self, now=None):
+        """安排每个任务的首次运行，停机期间错过的运行按catch_up补跑"""
+        now = now or datetime.now()
+        for job in self.jobs:
+            missed = job.last_slot(now)
+            last = self.state.get(job.name)
+            if job.catch_up and now - missed <= timedelta(seconds=job.catch_up) and (
+                    last is None or datetime.fromisoformat(last) < missed):
+                logger.info(f"{job.name} 错过了 {missed:%Y-%m-%d %H:%M} 的运行，立即补跑")
+                job.next_run = now
+            else:
+                job.schedule_next(now)
+                logger.info(f"{job.name} 下次运行: {job.next_run:%Y-%m-%d %H:%M:%S}")
+    
+    def run_pending(self, now=None):
+        """提交到期的任务；工作线程或站点配额不足的任务保持到期状态，有任务结束时再分配"""
+        now = now or datetime.now()
+        due = sorted((job for job in self.jobs if job.next_run <= now),
+                     key=lambda job: (job.priority, job.next_run))
+        with self.lock:
+            for job in due:
+                if job.running >= job.max_concurrency:
+                    logger.warning(f"{job.name} 上一次运行尚未结束，本次跳过")
+                    job.schedule_next(now)
+                    continue
+                if len(self.active) >= self.pool_size:
+                    break
+                if job.host and self.hosts.get(job.host, 0) >= self.host_concurrency:
+                    continue
+                self._submit(job, now)
+                job.schedule_next(now)
+                logger.info(f"{job.name} 下次运行: {job.next_run:%Y-%m-%d %H:%M:%S}")
     
-    # 持续运行，检查定时任务
-    while True:
+    def _submit(self, job, now):
+        deadline = time.monotonic() + job.budget
+        job.running += 1
+        if job.host:
+            self.hosts[job.host] = self.hosts.get(job.host, 0) + 1
+        future = self.pool.submit(self._execute, job, deadline, now)
+        self.active[future] = (job, deadline)
+        future.add_done_callback(self._finished)
+    
+    def _execute(self, job, deadline, started_at):
+        start = time.perf_counter()
         try:
-            schedule.run_pending()
-            time.sleep(60)  # 每分钟检查一次
-        except KeyboardInterrupt:
-            logger.info("定时任务被手动停止")
-            break
+            logger.info(f"开始执行 {job.name}")
+            job.func(deadline)
         except Exception as e:
-            logger.error(f"定时任务异常: {e}")
-            time.sleep(60)
+            logger.error(f"❌ {job.name} 执行失败: {e}")
+            return
+        logger.info(f"✅ {job.name} 执行完成，耗时 {time.perf_counter() - start:.1f} 秒")
+        with self.lock:
+            self.state[job.name] = started_at.isoformat(timespec='seconds')
+            self._save_state()
+    
+    def _finished(self, future):
+        with self.lock:
+            job, _ = self.active.pop(future)
+            self.overdue.discard(future)
+            job.running -= 1
+            if job.host:
+                self.hosts[job.host] -= 1
+        self.wakeup.set()
+    
+    def check_budgets(self):
+        """超过运行时限加收尾时间仍未结束的任务记录错误（每次运行只记录一次）"""
+        now = time.monotonic()
+        with self.lock:
+            for future, (job, deadline) in self.active.items():
+                if future not in self.overdue and now > deadline + self.grace:
+                    self.overdue.add(future)
+                    logger.error(f"{job.name} 超过时限 {job.budget + self.grace} 秒仍未结束，结束前不会再次启动")
+    
+    def idle_seconds(self, now=None):
+        """距离下一个触发时刻的秒数；已到期但在等待资源的任务由任务结束唤醒"""
+        now = now or datetime.now()
+        waits = [(job.next_run - now).total_seconds() for job in self.jobs if job.next_run > now]
+        return max(0.0, min([POLL_INTERVAL, *waits]))
+    
+    def run_forever(self):
+        self.start()
+        while True:
+            try:
+                self.run_pending()
+                self.check_budgets()
+                self.wakeup.wait(self.idle_seconds())
+                self.wakeup.clear()
+            except KeyboardInterrupt:
+                logger.info("定时任务被手动停止")
+                break
+            except Exception as e:
+                logger.error(f"定时任务异常: {e}")
+                time.sleep(POLL_INTERVAL)
+        self.pool.shutdown(wait=False)
+
+class FundCrawlerJob:
+    """基金从业资格爬虫：模块只导入一次，数据库连接池和HTTP长连接跨次复用"""
+    
+    def __init__(self):
+        import fund_crawler
+        self.crawler = fund_crawler
+        self.session = fund_crawler.get_session()
+        try:
+            self.engine = fund_crawler.get_engine()
+        except Exception as e:
+            # 数据库不可用时仍然抓取和写Excel，由run_pipeline记录写库失败
+            logger.error(f"数据库连接创建失败: {e}")
+            self.engine = None
+    
+    def __call__(self, deadline):
+        # 写库失败时run_pipeline抛出异常，由调度器记为失败、不写入成功时间
+        total = self.crawler.run_pipeline(session=self.session, deadline=deadline)
+        if not total:
+            raise RuntimeError("未爬取到数据")
+        logger.info(f"基金从业资格爬取完成: {total} 条数据")
+    
+    def close(self):
+        self.session.close()
+        if self.engine is not None:
+            self.engine.dispose()
+
+class QSRequestsJob:
+    """QS排名（requests版）：模块只导入一次，数据库连接池跨次复用；单页请求，不需要运行时限"""
+    
+    def __init__(self):
+        import QS_requests
+        self.crawler = QS_requests
+    
+    def __call__(self, deadline):
+        # 失败时抛出异常，由调度器记为失败、不写入成功时间
+        rows = self.crawler.scrape_qs_rankings_requests()
+        if not rows:
+            raise RuntimeError("未爬取到数据")
+        logger.info(f"QS排名(requests)爬取完成: {rows} 条数据")
+    
+    def close(self):
+        self.crawler.dispose_engine()
+
+class QStopJob:
+    """QS排名（QStop.py）：模块只导入一次，数据库连接池和HTTP长连接跨次复用"""
+    
+    def __init__(self):
+        import QStop
+        self.crawler = QStop
+        self.session = QStop.get_session()
+    
+    def __call__(self, deadline):
+        # 写库失败时run抛出异常，由调度器记为失败、不写入成功时间
+        df = self.crawler.run(session=self.session, deadline=deadline)
+        if df.empty:
+            raise RuntimeError("未爬取到数据")
+        logger.info(f"QS排名爬取完成: {len(df)} 条数据")
+    
+    def close(self):
+        self.session.close()
+        self.crawler.dispose_engine()
+
+JOB_FACTORIES = {
+    'fund_crawler': FundCrawlerJob,
+    'qstop': QStopJob,
+    'qs_requests': QSRequestsJob,
+}
+
+def main():
+    """主函数"""
+    setup_logging()
+    logger.info("爬虫定时任务启动")
+    
+    callables = {}
+    jobs = []
+    for name, config in JOBS.items():
+        try:
+            callables[name] = JOB_FACTORIES[name]()
+        except Exception as e:
+            logger.error(f"{name} 初始化失败，不参与调度: {e}")
+            continue
+        jobs.append(ScheduledJob(name, callables[name], **config))
+        logger.info(f"{name}: 每天 {', '.join(config['at'])}，站点 {config['host']}，优先级 {config['priority']}")
+    
+    scheduler = Scheduler(jobs)
+    logger.info("定时任务已启动，等待执行...")
+    scheduler.run_forever()
+    
+    for job in callables.values():
+        job.close()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,218 @@
+"""本地HTTP响应缓存（SQLite文件），挂在requests会话上对调用方透明
+
+- 缓存键：请求方法 + URL（去掉易变参数、参数排序）+ 请求体
+- 未过期直接返回缓存；过期但有 ETag/Last-Modified 时发条件请求，304 则续期
+- 超过TTL且无校验信息的条目在打开缓存时清理；写入时维护总大小，超出容量上限才按最久未使用淘汰
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from requests import Request, Response
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+CACHE_PATH = 'cache/http_cache.sqlite'
+VOLATILE_PARAMS = ('rand', 'loggedincache', '_')
+# 缓存的是解码后的内容，这些头不再适用
+_DROP_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding', 'connection')
+
+
+def cache_key(method, url, body=None, volatile_params=VOLATILE_PARAMS):
+    """计算缓存键：忽略易变参数，参数按名称排序"""
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if k not in volatile_params)
+    normalized = urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, urlencode(query), ''))
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    digest = hashlib.sha256(f"{method.upper()} {normalized}\n".encode('utf-8'))
+    digest.update(body or b'')
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """SQLite存储的响应缓存，线程安全"""
+
+    def __init__(self, path=CACHE_PATH, ttl=86400, max_bytes=512 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                status INTEGER,
+                headers TEXT,
+                content BLOB,
+                etag TEXT,
+                last_modified TEXT,
+                size INTEGER,
+                stored_at REAL,
+                accessed_at REAL
+            )
+        """)
+        # 按最久未使用淘汰时顺序扫描，不需要对全表排序
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed_at ON responses (accessed_at)")
+        self.conn.commit()
+        self.total_size = 0
+        self.evict()
+
+    def get(self, key):
+        """返回 (entry, 是否未过期)，未命中返回 (None, False)"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status, headers, content, etag, last_modified, stored_at FROM responses WHERE key = ?",
+                (key,)
+            ).fetchone()
+            if row is None:
+                return None, False
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+        status, headers, content, etag, last_modified, stored_at = row
+        entry = {
+            'status': status,
+            'headers': _decode_headers(headers),
+            'content': content,
+            'etag': etag,
+            'last_modified': last_modified
+        }
+        return entry, time.time() - stored_at < self.ttl
+
+    def is_fresh(self, key):
+        """只查存储时间，判断是否有未过期的条目"""
+        with self.lock:
+            row = self.conn.execute("SELECT stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+        return row is not None and time.time() - row[0] < self.ttl
+
+    def put(self, key, url, status, headers, content):
+        headers = {k: v for k, v in headers.items() if k.lower() not in _DROP_HEADERS}
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, status, _encode_headers(headers), content,
+                 headers.get('ETag'), headers.get('Last-Modified'), len(content), now, now)
+            )
+            self.total_size += len(content) - (row[0] if row else 0)
+            if self.total_size > self.max_bytes:
+                self._evict_lru()
+            self.conn.commit()
+
+    def touch(self, key):
+        """条件请求返回304时续期"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("UPDATE responses SET stored_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+            self.conn.commit()
+
+    def evict(self):
+        """删除过期且无法再校验的条目，重新统计总大小，再按最久未使用淘汰到容量上限以内（打开缓存时调用）"""
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM responses WHERE stored_at < ? AND etag IS NULL AND last_modified IS NULL",
+                (time.time() - self.ttl,)
+            )
+            self.total_size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if self.total_size > self.max_bytes:
+                self._evict_lru()
+            self.conn.commit()
+
+    def _evict_lru(self, batch=100):
+        """按 accessed_at 索引从最久未使用的条目删起，直到总大小不超过上限，调用方持有锁"""
+        while self.total_size > self.max_bytes:
+            rows = self.conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at LIMIT ?", (batch,)
+            ).fetchall()
+            if not rows:
+                self.total_size = 0
+                return
+            for key, size in rows:
+                if self.total_size <= self.max_bytes:
+                    return
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.total_size -= size
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class CachingAdapter(HTTPAdapter):
+    """带本地缓存的传输适配器，用法与HTTPAdapter相同：session.mount('https://', CachingAdapter(cache))"""
+
+    def __init__(self, cache, volatile_params=VOLATILE_PARAMS, **kwargs):
+        self.cache = cache
+        self.volatile_params = volatile_params
+        super().__init__(**kwargs)
+
+    def is_fresh(self, request):
+        """该请求是否能直接由未过期的缓存返回"""
+        key = cache_key(request.method, request.url, request.body, self.volatile_params)
+        return self.cache.is_fresh(key)
+
+    def send(self, request, **kwargs):
+        key = cache_key(request.method, request.url, request.body, self.volatile_params)
+        entry, fresh = self.cache.get(key)
+        if entry and fresh:
+            return self._cached_response(request, entry)
+
+        if entry:
+            if entry['etag']:
+                request.headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                request.headers['If-Modified-Since'] = entry['last_modified']
+
+        response = super().send(request, **kwargs)
+        if response.status_code == 304 and entry:
+            self.cache.touch(key)
+            return self._cached_response(request, entry)
+        if response.status_code == 200 and not kwargs.get('stream'):
+            self.cache.put(key, request.url, response.status_code, response.headers, response.content)
+        response.from_cache = False
+        return response
+
+    def _cached_response(self, request, entry):
+        response = Response()
+        response.status_code = entry['status']
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = entry['content']
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(0)
+        response.from_cache = True
+        return response
+
+
+def is_cached(session, method, url, **kwargs):
+    """判断请求能否直接命中缓存，命中时调用方可以跳过限速等待"""
+    adapter = session.get_adapter(url)
+    if not isinstance(adapter, CachingAdapter):
+        return False
+    request = session.prepare_request(Request(method, url, **kwargs))
+    return adapter.is_fresh(request)
+
+
+def _encode_headers(headers):
+    return '\n'.join(f"{k}: {v}" for k, v in headers.items())
+
+
+def _decode_headers(text):
+    headers = {}
+    for line in (text or '').split('\n'):
+        if ': ' in line:
+            k, v = line.split(': ', 1)
+            headers[k] = v
+    return headers
@@ -0,0 +1,98 @@
+"""共享HTTP传输层：各爬虫的会话都由 create_session() 创建
+
+    连接池    每个主机一个连接池，大小等于爬虫的并发数，请求之间复用长连接（keep-alive）
+    压缩      Accept-Encoding 只声明urllib3能解码的格式：gzip/deflate，加上br需要brotli（在requirements.txt中）
+    超时      调用方不传 timeout 时使用 (连接超时, 读取超时)，连接失败快速暴露，不占满读取超时
+    重试      连接失败、读超时由传输层有限次重试，指数退避加随机抖动；
+              HTTP状态码（429/5xx）不在传输层重试，交给爬虫的重试循环，限速器才能看到每次限流
+    TLS       默认校验证书
+
+爬虫自己的重试循环用 backoff_delay() 计算等待时间，单页最多发出
+页重试次数 × (1 + 传输层重试次数) 个请求。
+"""
+import random
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+from urllib3.util.request import ACCEPT_ENCODING
+
+from http_cache import CachingAdapter
+
+CONNECT_TIMEOUT = 5      # 秒
+READ_TIMEOUT = 30
+CONNECT_RETRIES = 2      # 传输层对连接失败的重试次数
+READ_RETRIES = 1         # 传输层对读超时/连接中断的重试次数
+BACKOFF_FACTOR = 0.5     # 第n次重试前等待 BACKOFF_FACTOR * 2^(n-1) 秒左右
+BACKOFF_MAX = 30
+BACKOFF_JITTER = 0.5     # 传输层重试在退避时间上随机增加的最长秒数
+HOST_POOLS = 10          # 保留连接池的主机数
+VERIFY_TLS = True        # 证书校验，也可以是CA证书文件路径（代理/自签证书环境）
+# 爬虫重试循环中按可重试处理的状态码
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36',
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Accept-Encoding': ACCEPT_ENCODING,
+    'Connection': 'keep-alive'
+}
+
+
+class TransportSession(requests.Session):
+    """未指定timeout的请求使用会话的默认超时"""
+
+    def __init__(self, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().request(method, url, **kwargs)
+
+
+def retry_policy(connect=CONNECT_RETRIES, read=READ_RETRIES):
+    """传输层重试策略：只重试连接失败和读超时，不按状态码重试（也不按Retry-After等待）"""
+    return Retry(
+        total=connect + read,
+        connect=connect,
+        read=read,
+        status=0,
+        other=0,
+        # 两个接口的POST都是只读查询，可以安全重发
+        allowed_methods=None,
+        backoff_factor=BACKOFF_FACTOR,
+        backoff_max=BACKOFF_MAX,
+        backoff_jitter=BACKOFF_JITTER,
+        respect_retry_after_header=False,
+        raise_on_status=False
+    )
+
+
+def backoff_delay(retry):
+    """爬虫重试循环第retry次重试（从1开始）前的等待秒数：指数退避，在后一半区间内随机取值"""
+    delay = min(BACKOFF_MAX, BACKOFF_FACTOR * 2 ** (retry - 1))
+    return random.uniform(delay / 2, delay)
+
+
+def create_session(pool_size, headers=None, cache=None, archive=None, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                   verify=VERIFY_TLS):
+    """创建会话
+
+    pool_size 为爬虫的并发请求数；headers 在默认请求头上补充/覆盖站点相关的请求头；
+    cache 为 ResponseCache 时经本地缓存收发；传入 archive 时记录收到的每个原始响应。
+    """
+    session = TransportSession(timeout)
+    kwargs = {'pool_connections': HOST_POOLS, 'pool_maxsize': pool_size, 'max_retries': retry_policy()}
+    adapter = CachingAdapter(cache, **kwargs) if cache else HTTPAdapter(**kwargs)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    if headers:
+        session.headers.update(headers)
+    session.verify = verify
+    if archive:
+        archive.attach(session)
+    return session
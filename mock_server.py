@@ -0,0 +1,252 @@
+"""本地模拟接口：替代 topuniversities.com 和 gs.amac.org.cn，供基准测试和离线调试使用
+
+两个接口与线上路径一致，爬虫只需把 API_URL 的域名换成本地地址：
+    GET  /rankings/endpoint?page=&items_per_page=      QS排名，返回 score_nodes / total_pages
+    POST /amac-infodisc/api/pof/person?page=&size=     基金从业人员，返回 content / totalPages / totalElements
+
+数据来源二选一：
+    按 --qs-rows / --fund-rows 生成合成数据（按页用固定种子生成，同一页每次内容相同，不占内存）
+    --replay 指定 archive/ 下的原始响应归档，按页号重放当时收到的响应
+
+用法:
+    python mock_server.py --fund-rows 1000000 --latency 0.05 --error-rate 0.01
+    python mock_server.py --replay archive/fund_crawler_20250806_070000.jsonl.gz --port 8765
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+QS_PATH = '/rankings/endpoint'
+FUND_PATH = '/amac-infodisc/api/pof/person'
+QS_ROWS = 1500
+FUND_ROWS = 100000
+SEED = 20250806
+# 注入错误时返回的状态码，按出现概率相同随机选
+ERROR_STATUSES = [429, 500, 502, 503]
+
+SURNAMES = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗'
+GIVEN_NAMES = '伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂英'
+EDUCATIONS = ['本科', '硕士研究生', '博士研究生', '大专', '其他']
+CERT_NAMES = ['基金从业资格', '基金销售资格', '私募股权投资基金从业资格']
+STATUSES = ['正常', '离职', '注销']
+COUNTRIES = [('United States', 'Americas'), ('United Kingdom', 'Europe'), ('China (Mainland)', 'Asia'),
+             ('Germany', 'Europe'), ('Australia', 'Oceania'), ('Japan', 'Asia'), ('Canada', 'Americas'),
+             ('France', 'Europe'), ('India', 'Asia'), ('Brazil', 'Americas')]
+# 名称只差括号内容、path不同的两所真实大学，合成数据里带上它们，检验维度表不会合并成一个id
+NAMESAKES = {
+    450: ('Soochow University', 'soochow-university'),
+    451: ('Soochow University (Taiwan)', 'soochow-university-taiwan')
+}
+
+
+def qs_rank(i):
+    """第i所大学的排名文本，与线上格式一致：并列 '=12'，601名后为区间 '601-610'，1001名后为 '1001+'"""
+    if i < 600:
+        return f'={i + 1}' if i % 9 == 8 else str(i + 1)
+    if i < 1000:
+        low = i // 10 * 10 + 1
+        return f'{low}-{low + 9}'
+    return '1401+' if i >= 1400 else '1001+'
+
+
+def qs_page(page, per_page, total, seed=SEED):
+    """第page页的 score_nodes"""
+    rng = random.Random(seed * 100003 + page)
+    nodes = []
+    for i in range(page * per_page, min(total, (page + 1) * per_page)):
+        country, region = rng.choice(COUNTRIES)
+        title, slug = NAMESAKES.get(i, (f'University {i}', f'university-{i}'))
+        nodes.append({
+            'nid': str(294000 + i),
+            'core_id': str(400 + i),
+            'rank': qs_rank(i),
+            'rank_display': qs_rank(i),
+            'overall_score': f'{max(100 - i * 0.09, 10):.1f}' if i < 600 else '',
+            'title': title,
+            'path': f'/universities/{slug}',
+            'region': region,
+            'country': country,
+            'city': f'City {rng.randint(1, 500)}',
+            'logo': f'/sites/default/files/{slug}_logo.jpg',
+            'stars': '',
+            'dagger': False,
+            'redact': False
+        })
+    return nodes
+
+
+def fund_page(page, size, total, seed=SEED):
+    """第page页的基金从业人员记录"""
+    rng = random.Random(seed * 100019 + page)
+    content = []
+    for i in range(page * size, min(total, (page + 1) * size)):
+        content.append({
+            'id': str(1700000000000000 + i),
+            'userName': rng.choice(SURNAMES) + ''.join(rng.choices(GIVEN_NAMES, k=rng.randint(1, 2))),
+            'sex': rng.choice(['男', '女']),
+            'certCode': f'F{i:010d}',
+            'orgName': f'模拟基金管理有限公司{rng.randint(1, 5000)}',
+            'certName': rng.choice(CERT_NAMES),
+            'certObtainDate': rng.randint(1_200_000_000, 1_750_000_000) * 1000,
+            'certStatusChangeTimes': rng.randint(0, 3),
+            'creditRecordNum': rng.randint(0, 1),
+            'statusName': rng.choice(STATUSES),
+            'educationName': rng.choice(EDUCATIONS)
+        })
+    return content
+
+
+def load_replay(path):
+    """从响应归档读出 {(接口路径, 页号): 响应文本}，同一页重复记录时取最后一次成功的响应"""
+    from response_archive import iter_archive
+    pages = {}
+    for record in iter_archive(path):
+        if record.get('status') != 200:
+            continue
+        url = urlparse(record['url'])
+        page = int(parse_qs(url.query).get('page', ['0'])[0])
+        pages[(url.path, page)] = record['content']
+    return pages
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self):
+        config = self.server.config
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        config.count(url.path)
+
+        if config.latency:
+            time.sleep(config.latency + random.uniform(0, config.latency_jitter))
+        if config.error_rate and random.random() < config.error_rate:
+            self._send(random.choice(ERROR_STATUSES), '{"error": "injected"}')
+            return
+
+        body = config.respond(url.path, query)
+        if body is None:
+            self._send(404, '{"error": "not found"}')
+        else:
+            self._send(200, body)
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class MockServer:
+    """模拟接口服务，在后台线程中运行；port为0时使用随机空闲端口"""
+
+    def __init__(self, qs_rows=QS_ROWS, fund_rows=FUND_ROWS, latency=0.0, latency_jitter=0.0, error_rate=0.0,
+                 replay=None, host='127.0.0.1', port=0, seed=SEED):
+        self.qs_rows = qs_rows
+        self.fund_rows = fund_rows
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.seed = seed
+        self.replayed = load_replay(replay) if replay else None
+        self.requests = {}
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), MockHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.config = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def qs_url(self):
+        return self.url + QS_PATH
+
+    @property
+    def fund_url(self):
+        return self.url + FUND_PATH
+
+    def count(self, path):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def respond(self, path, query):
+        """响应文本，未知路径或重放中没有该页时返回None"""
+        page = int(query.get('page', ['0'])[0])
+        if self.replayed is not None:
+            return self.replayed.get((path, page))
+        if path == QS_PATH:
+            per_page = int(query.get('items_per_page', ['30'])[0])
+            return json.dumps({
+                'score_nodes': qs_page(page, per_page, self.qs_rows, self.seed),
+                'total_pages': -(-self.qs_rows // per_page),
+                'total_record': self.qs_rows
+            }, ensure_ascii=False)
+        if path == FUND_PATH:
+            size = int(query.get('size', ['20'])[0])
+            return json.dumps({
+                'content': fund_page(page, size, self.fund_rows, self.seed),
+                'totalPages': -(-self.fund_rows // size),
+                'totalElements': self.fund_rows,
+                'number': page,
+                'size': size
+            }, ensure_ascii=False)
+        return None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='mock-server', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟QS排名和基金从业人员接口')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--qs-rows', type=int, default=QS_ROWS, help='QS排名合成数据行数')
+    parser.add_argument('--fund-rows', type=int, default=FUND_ROWS, help='基金从业人员合成数据行数')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个响应固定延迟（秒）')
+    parser.add_argument('--latency-jitter', type=float, default=0.0, help='在固定延迟上再随机增加的最长秒数')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='随机返回429/5xx的概率')
+    parser.add_argument('--replay', help='重放的响应归档文件（archive/*.jsonl.gz）')
+    args = parser.parse_args()
+
+    server = MockServer(args.qs_rows, args.fund_rows, args.latency, args.latency_jitter, args.error_rate,
+                        args.replay, port=args.port)
+    print(f"模拟接口: {server.qs_url}")
+    print(f"          {server.fund_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
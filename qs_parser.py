@@ -0,0 +1,63 @@
+"""QS排名 score_nodes 解析：逐条提取字段，最后一次性构造带类型的DataFrame
+
+QS_requests.py 和 QStop.py 共用，替代逐条 dict + try/except 的写法。
+QStop 每页（30条）调用一次，所以每次调用只构造一次DataFrame，不做逐列的pandas转换
+（pandas每次调用的固定开销在30行的页上远大于逐条提取本身）。
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+# 接口字段 -> 输出列
+FIELD_MAP = {
+    'title': 'university_name',
+    'country': 'country',
+    'city': 'city',
+    'region': 'region',
+    'logo': 'logo_url',
+    'path': 'path'
+}
+COLUMNS = ['rank', 'overall_score', 'university_name', 'location', 'country', 'city',
+           'region', 'logo_url', 'path']
+RANK_PATTERN = re.compile(r'\d+')
+
+
+def parse_rank(value):
+    """排名转整数：'12' / '=12' / '601-610' / '1001+' -> 12 / 12 / 601 / 1001，无法解析返回None"""
+    if value is None:
+        return None
+    match = RANK_PATTERN.search(str(value))
+    return int(match.group()) if match else None
+
+
+def parse_score(value):
+    """总分转浮点数，空串等无法解析的值为NaN（601名以后没有总分）"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def text(value):
+    return '' if value is None else str(value)
+
+
+def parse_score_nodes(score_nodes, columns=COLUMNS):
+    """score_nodes列表 -> (DataFrame, 被拒绝的行数)；排名无法解析的行被拒绝"""
+    data = {column: [] for column in ['rank', 'overall_score', *FIELD_MAP.values(), 'location']}
+    rejected = 0
+    for node in score_nodes:
+        rank = parse_rank(node.get('rank'))
+        if rank is None:
+            rejected += 1
+            continue
+        data['rank'].append(rank)
+        data['overall_score'].append(parse_score(node.get('overall_score')))
+        for field, column in FIELD_MAP.items():
+            data[column].append(text(node.get(field)))
+        data['location'].append(f"{data['city'][-1]}, {data['country'][-1]}".strip(', '))
+
+    data['rank'] = pd.array(data['rank'], dtype='Int32')
+    data['overall_score'] = np.array(data['overall_score'], dtype='float64')
+    return pd.DataFrame({column: data[column] for column in columns}), rejected
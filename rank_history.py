@@ -0,0 +1,185 @@
+"""QS排名时间序列存储：按 crawl_date 分区的排名事实表（大学信息见 university_dim.py）
+
+事实表不再每次运行 DROP 重建，而是按年份 RANGE 分区累积历史；
+主键 (university_id, crawl_date) 为聚簇索引，单个大学的历年排名物理上连续存放，
+轨迹查询只走主键即可取到排名和分数，不需要回表。
+"""
+import pandas as pd
+from sqlalchemy import text, bindparam
+
+from bulk_writer import bulk_upsert
+from storage import backend_for
+from university_dim import normalize_name
+
+# 初始只有一个兜底分区，写入时按年份从 pmax 中拆出
+PARTITION_SQL = "PARTITION BY RANGE (TO_DAYS(crawl_date)) (PARTITION pmax VALUES LESS THAN MAXVALUE)"
+
+
+def table_columns(conn, table):
+    """表的列名列表，表不存在时返回空列表"""
+    rows = conn.execute(text("""
+        SELECT COLUMN_NAME FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table
+    """), {'table': table})
+    return [row[0] for row in rows]
+
+
+def migrate_legacy_table(conn, table, create_sql, fact_columns, resolver):
+    """旧表（事实行里存大学名称）改名为 <表>_legacy 后按新结构重建，旧数据解析出university_id后复制过来"""
+    columns = table_columns(conn, table)
+    if 'university_name' not in columns:
+        return False
+    legacy = f'{table}_legacy'
+    conn.execute(text(f"DROP TABLE IF EXISTS {legacy}"))
+    conn.execute(text(f"RENAME TABLE {table} TO {legacy}"))
+    conn.execute(text(create_sql))
+
+    # 旧表中的名称、path和描述字段交给解析器登记到维度表
+    dimension_columns = [col for col in ['university_name', 'path', 'location', 'country', 'city',
+                                         'region', 'logo_url'] if col in columns]
+    universities = pd.read_sql(text(f"SELECT DISTINCT {', '.join(dimension_columns)} FROM {legacy}"), conn)
+    universities = universities.drop_duplicates('university_name')
+    universities['university_id'] = resolver.resolve(universities)
+
+    conn.execute(text(f"""
+        CREATE TEMPORARY TABLE {legacy}_ids (
+            university_name VARCHAR(255) NOT NULL PRIMARY KEY,
+            university_id INT UNSIGNED NOT NULL
+        ) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4
+    """))
+    conn.execute(text(f"INSERT INTO {legacy}_ids VALUES (:university_name, :university_id)"),
+                 [{'university_name': name, 'university_id': int(university_id)}
+                  for name, university_id in zip(universities['university_name'], universities['university_id'])])
+    ensure_partitions(conn, table, *[row[0] for row in conn.execute(
+        text(f"SELECT DISTINCT crawl_date FROM {legacy}"))])
+    column_sql = ', '.join(f'`{col}`' for col in fact_columns)
+    select_sql = ', '.join(f'l.`{col}`' for col in fact_columns)
+    conn.execute(text(f"""
+        INSERT IGNORE INTO {table} (university_id, {column_sql})
+        SELECT m.university_id, {select_sql}
+        FROM {legacy} l JOIN {legacy}_ids m ON m.university_name = l.university_name
+    """))
+    conn.execute(text(f"DROP TEMPORARY TABLE {legacy}_ids"))
+    return True
+
+
+def create_rank_table(conn, table, legacy_columns, resolver, crawl_date=None):
+    """按表定义（storage.Table）建排名事实表，返回是否迁移了旧表
+
+    MySQL上按年份分区，先迁移旧结构的表，再保证crawl_date所在年份的分区存在；
+    其他后端不分区，只建表。
+    """
+    backend = backend_for(conn.engine)
+    if backend.name != 'mysql':
+        backend.create_table(table, conn)
+        return False
+    create_sql = f'{backend.create_table_sql(table)[0]}\n{PARTITION_SQL}'
+    migrated = migrate_legacy_table(conn, table.name, create_sql, legacy_columns, resolver)
+    conn.execute(text(create_sql))
+    if crawl_date:
+        ensure_partitions(conn, table.name, crawl_date)
+    return migrated
+
+
+def ensure_partitions(conn, table, *crawl_dates):
+    """保证 crawl_dates 所在年份都有独立分区（从 pmax 拆出，分区只能向后追加）"""
+    if not crawl_dates:
+        return
+    rows = conn.execute(text("""
+        SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL
+    """), {'table': table})
+    years = [int(name[1:]) for (name,) in rows if name != 'pmax']
+    target = max(pd.Timestamp(d).year for d in crawl_dates)
+    # 早于已有分区的年份落在最早的分区中，不需要新建
+    first = max(years) + 1 if years else min(pd.Timestamp(d).year for d in crawl_dates)
+    if target < first:
+        return
+    partitions = ', '.join(
+        f"PARTITION p{year} VALUES LESS THAN (TO_DAYS('{year + 1}-01-01'))"
+        for year in range(first, target + 1)
+    )
+    conn.execute(text(f"""
+        ALTER TABLE {table} REORGANIZE PARTITION pmax INTO
+        ({partitions}, PARTITION pmax VALUES LESS THAN MAXVALUE)
+    """))
+
+
+def partition_for(conn, table, crawl_date):
+    """crawl_date 所在的分区名"""
+    days = conn.execute(text("SELECT TO_DAYS(:d)"), {'d': crawl_date}).scalar()
+    rows = conn.execute(text("""
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """), {'table': table})
+    for name, description in rows:
+        if description == 'MAXVALUE' or days < int(description):
+            return name
+    return None
+
+
+def exchange_load(engine, table, df, columns, crawl_date, indexes, update_columns=(), batch_size=1000):
+    """把一期数据装载到独立的暂存表，建好索引后用 EXCHANGE PARTITION 原子换入正式表
+
+    暂存表是去掉分区、去掉二级索引的同结构普通表：先复制该分区里其他期的数据，再批量插入本期，
+    最后一次性建二级索引并与分区交换。交换前读者看到的一直是旧数据，装载中途失败也不会留下半期数据。
+    indexes 为二级索引 {索引名: 列}，即正式表 Table 定义中的 indexes。
+    """
+    staging = f'{table}_staging'
+    with engine.begin() as conn:
+        ensure_partitions(conn, table, crawl_date)
+        partition = partition_for(conn, table, crawl_date)
+        conn.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+        conn.execute(text(f"CREATE TABLE {staging} LIKE {table}"))
+        conn.execute(text(f"ALTER TABLE {staging} REMOVE PARTITIONING"))
+        for name in indexes:
+            conn.execute(text(f"ALTER TABLE {staging} DROP INDEX {name}"))
+        conn.execute(text(f"""
+            INSERT INTO {staging} SELECT * FROM {table} PARTITION ({partition})
+            WHERE crawl_date <> :crawl_date
+        """), {'crawl_date': crawl_date})
+
+    try:
+        stats = bulk_upsert(engine, staging, df, columns, update_columns, batch_size=batch_size)
+        with engine.begin() as conn:
+            backend = backend_for(engine)
+            index_sql = ', '.join(f"ADD INDEX {name} ({backend.column_list(index_columns)})"
+                                  for name, index_columns in indexes.items())
+            if index_sql:
+                conn.execute(text(f"ALTER TABLE {staging} {index_sql}"))
+            conn.execute(text(f"ALTER TABLE {table} EXCHANGE PARTITION {partition} WITH TABLE {staging}"))
+    finally:
+        # 交换后暂存表里是旧分区的数据；失败时是未换入的新数据，都可以丢弃
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+    return stats
+
+
+def rank_trajectory(engine, table, universities=None, editions=5):
+    """最近 editions 期的排名和分数轨迹
+
+    返回长表 (university_id, university_name, crawl_date, rank, overall_score)，
+    universities 为大学名称列表（按规范化名称匹配），None表示全部大学。
+    """
+    with engine.connect() as conn:
+        dates = [row[0] for row in conn.execute(
+            text(f"SELECT DISTINCT crawl_date FROM {table} ORDER BY crawl_date DESC LIMIT :n"),
+            {'n': editions}
+        )]
+        if not dates:
+            return pd.DataFrame(columns=['university_id', 'university_name', 'crawl_date', 'rank', 'overall_score'])
+
+        sql = f"""
+        SELECT r.university_id, u.university_name, r.crawl_date, r.`rank`, r.overall_score
+        FROM {table} r JOIN university_dim u ON u.id = r.university_id
+        WHERE r.crawl_date IN :dates
+        """
+        params = {'dates': dates}
+        statement = text(sql).bindparams(bindparam('dates', expanding=True))
+        if universities is not None:
+            statement = text(sql + " AND u.normalized_name IN :names").bindparams(
+                bindparam('dates', expanding=True), bindparam('names', expanding=True))
+            params['names'] = [normalize_name(name) for name in universities]
+        df = pd.read_sql(statement, conn, params=params)
+    return df.sort_values(['university_id', 'crawl_date']).reset_index(drop=True)
@@ -0,0 +1,98 @@
+"""共享限速组件：令牌桶 + AIMD 自适应调速
+
+各爬虫在发请求前调用 acquire()，拿到响应后调用 on_response()/on_error()，
+限速器据此在服务器能承受的范围内自动提速或降速。
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    """令牌桶：按rate(次/秒)匀速补充令牌，最多积累capacity个，线程安全"""
+
+    def __init__(self, rate, capacity=1.0):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.waited = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def set_rate(self, rate):
+        """调整补充速率（先按旧速率结算已积累的令牌）"""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+
+    def acquire(self, tokens=1.0):
+        """取走令牌，令牌不足时阻塞等待"""
+        while True:
+            with self.lock:
+                self._refill(time.monotonic())
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait_time = (tokens - self.tokens) / self.rate
+                # 累计等待时长，用于区分慢在限速还是慢在服务器
+                self.waited += wait_time
+            time.sleep(wait_time)
+
+
+class AdaptiveRateLimiter:
+    """AIMD限速器：成功时加性提速，429/5xx、网络异常或响应过慢时乘性降速"""
+
+    def __init__(self, initial_rate=2.0, min_rate=0.2, max_rate=10.0,
+                 increase=0.2, decrease=0.5, slow_threshold=5.0,
+                 cooldown=1.0, capacity=1.0):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_threshold = slow_threshold
+        self.cooldown = cooldown
+        self.bucket = TokenBucket(min(max(initial_rate, min_rate), max_rate), capacity)
+        self.lock = threading.Lock()
+        self.last_decrease = 0.0
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    @property
+    def waited(self):
+        """因限速累计等待的秒数（各线程相加）"""
+        return self.bucket.waited
+
+    def acquire(self):
+        """发请求前调用"""
+        self.bucket.acquire()
+
+    def on_response(self, status_code, latency):
+        """根据响应状态码和耗时(秒)调整速率"""
+        if status_code == 429 or status_code >= 500 or latency > self.slow_threshold:
+            self._back_off()
+        else:
+            self._ramp_up()
+
+    def on_error(self):
+        """请求异常（超时、连接失败等）时调用"""
+        self._back_off()
+
+    def _ramp_up(self):
+        with self.lock:
+            rate = min(self.max_rate, self.bucket.rate + self.increase)
+            self.bucket.set_rate(rate)
+
+    def _back_off(self):
+        with self.lock:
+            now = time.monotonic()
+            # 同一批在途请求的失败只降速一次
+            if now - self.last_decrease < self.cooldown:
+                return
+            self.last_decrease = now
+            rate = max(self.min_rate, self.bucket.rate * self.decrease)
+            self.bucket.set_rate(rate)
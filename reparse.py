@@ -0,0 +1,174 @@
+"""离线重新解析：从 archive/ 下的原始响应归档重跑解析、规范化和入库，不访问网络
+
+用法:
+    python reparse.py archive/fund_crawler_20250806_070000.jsonl.gz
+    python reparse.py archive/qs_requests_*.jsonl.gz --no-db
+    python reparse.py archive/*.jsonl.gz --no-excel
+
+QStop.py 的归档按 QStop 的流程写入 university_rank_simple（crawl_date为归档的爬取日期），
+QS_requests.py 的归档按 QS_requests 的流程写入 university_rank（crawl_date为爬取当月1日）。
+"""
+import argparse
+import glob
+import json
+import time
+from datetime import datetime
+from urllib.parse import parse_qs, urlparse
+
+from response_archive import iter_archive
+
+
+def iter_payloads(path):
+    """逐条产出归档中成功响应的 (记录, JSON数据)"""
+    for record in iter_archive(path):
+        if record.get('status') != 200:
+            continue
+        try:
+            yield record, json.loads(record['content'])
+        except (TypeError, ValueError):
+            continue
+
+
+def archived_page(record):
+    """记录对应的页号（请求URL中的page参数），没有时为None"""
+    values = parse_qs(urlparse(record['url']).query).get('page')
+    return int(values[0]) if values else None
+
+
+def iter_fund_pages(path):
+    """按归档中的page参数逐页产出 (页号, content)；断点续爬会重抓第0页、请求重试也会重复记录，同一页只取第一次"""
+    seen = set()
+    for record, data in iter_payloads(path):
+        page = archived_page(record)
+        if page is None or page in seen:
+            continue
+        seen.add(page)
+        yield page, data.get('content', [])
+
+
+def iter_qs_pages(path):
+    """逐页产出QS归档中的 score_nodes 数据；同一页在一次运行中可能因重试被记录多次，只取第一次"""
+    seen_urls = set()
+    for record, data in iter_payloads(path):
+        if record['url'] in seen_urls or 'score_nodes' not in data:
+            continue
+        seen_urls.add(record['url'])
+        yield data
+
+
+def archive_time(path):
+    """归档的爬取时间（第一条记录的时间），空归档为None"""
+    for record in iter_archive(path):
+        return datetime.fromisoformat(record['time'])
+    return None
+
+
+def archive_crawler(path):
+    for record in iter_archive(path):
+        return record.get('crawler')
+    return None
+
+
+def reparse_fund(path, excel=True, database=True):
+    """基金从业资格归档：走fund_crawler的规范化和分块sink"""
+    import fund_crawler
+    fund_crawler.setup_logging()
+
+    crawled_at = archive_time(path)
+    if crawled_at is None:
+        return 0
+    return fund_crawler.run_pipeline(
+        max_records=None,
+        pages=iter_fund_pages(path),
+        crawl_date=crawled_at.date(),
+        crawl_time=crawled_at.strftime('%Y-%m-%d %H:%M:%S'),
+        excel=excel,
+        database=database,
+        # 重新解析就是要用新的解析结果重写数据库，不能按增量索引跳过“未变化”的证书
+        incremental=False
+    )
+
+
+def reparse_qs(path, excel=True, database=True):
+    """QS_requests归档：走QS_requests的解析、导出文件和入库"""
+    import QS_requests
+
+    crawled_at = archive_time(path)
+    if crawled_at is None:
+        return 0
+    crawl_date = crawled_at.date().replace(day=1)
+    score_nodes = [node for data in iter_qs_pages(path) for node in data['score_nodes']]
+
+    df = QS_requests.parse_universities(score_nodes)
+    if df.empty:
+        return 0
+    if excel:
+        from sinks import write_frame
+        export_filename = f'QS大学排名_requests_{crawl_date}.{QS_requests.EXPORT_FORMAT}'
+        write_frame(df, export_filename)
+        print(f"数据已保存到 {export_filename}")
+    if database:
+        engine = QS_requests.get_database_engine()
+        if engine:
+            QS_requests.create_table_if_not_exists(engine, crawl_date)
+            QS_requests.save_to_database(df, engine, crawl_date)
+    return len(df)
+
+
+def reparse_qstop(path, excel=True, database=True):
+    """QStop归档：走QStop的逐页解析、导出文件和university_rank_simple入库"""
+    import QStop
+    QStop.setup_logging()
+
+    crawled_at = archive_time(path)
+    if crawled_at is None:
+        return 0
+    crawl_date = crawled_at.date()
+    frames = []
+    rejected = 0
+    for data in iter_qs_pages(path):
+        page_df, page_rejected = QStop.parse_universities(data)
+        frames.append(page_df)
+        rejected += page_rejected
+    df = QStop.combine_pages(frames, rejected)
+    if df.empty:
+        return 0
+    if excel:
+        from sinks import write_frame
+        export_filename = f'QS大学排名{crawl_date}.{QStop.EXPORT_FORMAT}'
+        write_frame(df[QStop.SIMPLE_COLUMNS], export_filename)
+        print(f"数据已保存到 {export_filename}")
+    if database:
+        engine = QStop.get_engine()
+        QStop.create_table_if_not_exists(engine, crawl_date)
+        QStop.save_to_database(engine, df.assign(crawl_date=crawl_date))
+    return len(df)
+
+
+REPARSERS = {
+    'fund_crawler': reparse_fund,
+    'qs_requests': reparse_qs,
+    'qstop': reparse_qstop
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='从原始响应归档离线重新解析入库')
+    parser.add_argument('paths', nargs='+', help='归档文件，支持通配符')
+    parser.add_argument('--no-excel', action='store_true', help='不生成导出文件')
+    parser.add_argument('--no-db', action='store_true', help='不写数据库')
+    args = parser.parse_args()
+
+    paths = sorted({p for pattern in args.paths for p in (glob.glob(pattern) or [pattern])})
+    for path in paths:
+        crawler = archive_crawler(path)
+        if crawler not in REPARSERS:
+            print(f"跳过 {path}: 无法识别的归档")
+            continue
+        start = time.perf_counter()
+        rows = REPARSERS[crawler](path, excel=not args.no_excel, database=not args.no_db)
+        print(f"{path}: {rows} 条数据，耗时 {time.perf_counter() - start:.2f} 秒")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""原始响应归档：每次运行一个 gzip 压缩的 JSONL 文件，只追加不修改
+
+挂到 requests 会话的 response 钩子上即可记录该会话收到的每个响应，
+之后可以用 reparse.py 直接从归档重新解析入库，不再访问网络。
+"""
+import gzip
+import json
+import os
+import threading
+from datetime import datetime
+
+ARCHIVE_DIR = 'archive'
+
+
+class ResponseArchive:
+    """单次运行的响应归档文件，线程安全"""
+
+    def __init__(self, crawler, directory=ARCHIVE_DIR):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.crawler = crawler
+        self.path = os.path.join(directory, f"{crawler}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl.gz")
+        self.file = gzip.open(self.path, 'at', encoding='utf-8')
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def attach(self, session):
+        """注册到会话的response钩子上，返回归档自身便于链式创建"""
+        session.hooks['response'].append(self.hook)
+        return self
+
+    def detach(self, session):
+        """从会话上取下钩子，会话继续给后续运行使用"""
+        if self.hook in session.hooks['response']:
+            session.hooks['response'].remove(self.hook)
+
+    def hook(self, response, *args, **kwargs):
+        self.record(response)
+        return response
+
+    def record(self, response):
+        body = response.request.body if response.request is not None else None
+        if isinstance(body, bytes):
+            body = body.decode('utf-8', errors='replace')
+        line = json.dumps({
+            'crawler': self.crawler,
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'method': response.request.method if response.request is not None else None,
+            'url': response.url,
+            'body': body,
+            'status': response.status_code,
+            'content': response.text
+        }, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + '\n')
+            # 逐条刷出压缩块，进程中途退出时已写入的记录仍可读
+            self.file.flush()
+            self.count += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def iter_archive(path):
+    """逐条读取归档记录，文件末尾不完整（进程异常退出）时读到最后一条完整记录为止"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                if line.endswith('\n'):
+                    yield json.loads(line)
+        except EOFError:
+            return
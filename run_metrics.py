@@ -0,0 +1,312 @@
+"""运行指标：按运行、按阶段记录耗时、记录数、请求延迟分布、流量、重试、状态码和峰值内存
+
+每次运行结束写两个文件到 metrics/：
+    <爬虫>.prom                  Prometheus textfile（node_exporter textfile collector 读取，每次运行覆盖）
+    <爬虫>_<时间>.json           本次运行的JSON汇总
+
+各阶段的耗时是该阶段内累计的耗时，在多个线程中并行的部分（并发请求、后台写库）会相加。
+内存取当前常驻内存（/proc/self/statm）在本次运行中的采样最大值及相对运行开始的增量：
+调度器在同一进程内连续运行各爬虫，ru_maxrss 是进程启动以来的峰值，只单独作为 process_peak_rss_bytes 输出。
+爬虫代码通过 get(名称) 取当前运行的指标对象，没有 start() 时取到的对象只记录不输出。
+start() 传入 StageProfiler（stage_profiler.py）时，各阶段同时做 cProfile/tracemalloc 剖析。
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS_DIR = 'metrics'
+# 请求延迟直方图的桶上界（秒）
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+_active = {}
+_active_lock = threading.Lock()
+
+try:
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = None
+
+
+def current_rss_bytes():
+    """当前常驻内存（字节），只支持Linux，其他平台返回None"""
+    if PAGE_SIZE is None:
+        return None
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def process_peak_rss_bytes():
+    """进程启动以来的峰值常驻内存（字节），包含同一进程中之前的运行，平台不支持时返回None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为KB，macOS 为字节
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class StageSink:
+    """包装一个带 write(df)/close() 的sink，把每次写入计入指定阶段"""
+
+    def __init__(self, sink, metrics, stage):
+        self.sink = sink
+        self.metrics = metrics
+        self.stage = stage
+
+    def write(self, df):
+        with self.metrics.stage(self.stage, rows=len(df)):
+            self.sink.write(df)
+
+    def close(self):
+        with self.metrics.stage(self.stage):
+            self.sink.close()
+
+
+class RunMetrics:
+    """单次运行的指标，线程安全"""
+
+    def __init__(self, crawler, directory=METRICS_DIR, profiler=None):
+        self.crawler = crawler
+        self.directory = directory
+        self.profiler = profiler
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.requests = 0
+        self.cached = 0
+        self.bytes = 0
+        self.status_codes = {}
+        self.counters = {'retries': 0, 'errors': 0}
+        self.start_rss = current_rss_bytes()
+        self.peak_rss = self.start_rss
+
+    def _sample_rss(self):
+        """采样当前常驻内存并更新本次运行的最大值，调用方持有锁"""
+        rss = current_rss_bytes()
+        if rss is not None and (self.peak_rss is None or rss > self.peak_rss):
+            self.peak_rss = rss
+        return rss
+
+    def _stage(self, name):
+        if name not in self.stages:
+            self.stages[name] = {'seconds': 0.0, 'rows': 0, 'calls': 0, 'peak_rss_bytes': None}
+        return self.stages[name]
+
+    def _stage_rss(self, stage):
+        rss = self._sample_rss()
+        if rss is not None and (stage['peak_rss_bytes'] is None or rss > stage['peak_rss_bytes']):
+            stage['peak_rss_bytes'] = rss
+
+    @contextmanager
+    def stage(self, name, rows=0):
+        """计时一段阶段内的工作，结束时累计耗时、记录数，并采样当前内存（取本次运行中该阶段的最大值）"""
+        start = time.perf_counter()
+        try:
+            with self.profile(name):
+                yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                stage = self._stage(name)
+                stage['seconds'] += elapsed
+                stage['rows'] += rows
+                stage['calls'] += 1
+                self._stage_rss(stage)
+
+    def profile(self, name):
+        """只剖析不计时（耗时已由其他方式统计的阶段，如由响应钩子统计的fetch）"""
+        return self.profiler.profile(name) if self.profiler else nullcontext()
+
+    def add_rows(self, name, rows):
+        with self.lock:
+            self._stage(name)['rows'] += rows
+
+    def count(self, name, value=1):
+        """累加计数器，如 retries、errors、rate_limit_wait_seconds"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def wrap_sink(self, stage, sink):
+        return StageSink(sink, self, stage)
+
+    def observe_response(self, response):
+        """记录一个HTTP响应的延迟、状态码和响应体大小；命中本地缓存的响应只计数"""
+        if getattr(response, 'from_cache', False):
+            with self.lock:
+                self.cached += 1
+            return
+        latency = response.elapsed.total_seconds()
+        size = len(response.content or b'')
+        index = next((i for i, bound in enumerate(LATENCY_BUCKETS) if latency <= bound), len(LATENCY_BUCKETS))
+        status = str(response.status_code)
+        with self.lock:
+            self.buckets[index] += 1
+            self.latency_sum += latency
+            self.requests += 1
+            self.bytes += size
+            self.status_codes[status] = self.status_codes.get(status, 0) + 1
+            fetch = self._stage('fetch')
+            fetch['seconds'] += latency
+            fetch['calls'] += 1
+            self._stage_rss(fetch)
+
+    def attach(self, session):
+        """注册到会话的response钩子上，返回自身"""
+        session.hooks['response'].append(self.hook)
+        return self
+
+    def detach(self, session):
+        if self.hook in session.hooks['response']:
+            session.hooks['response'].remove(self.hook)
+
+    def hook(self, response, *args, **kwargs):
+        self.observe_response(response)
+        return response
+
+    def summary(self):
+        """本次运行的指标汇总（dict）"""
+        with self.lock:
+            stages = {}
+            for name, stage in self.stages.items():
+                rate = stage['rows'] / stage['seconds'] if stage['seconds'] > 0 else None
+                stages[name] = dict(stage, rows_per_sec=rate)
+            cumulative = 0
+            histogram = {}
+            for bound, count in zip([*LATENCY_BUCKETS, '+Inf'], self.buckets):
+                cumulative += count
+                histogram[str(bound)] = cumulative
+            self._sample_rss()
+            increase = self.peak_rss - self.start_rss if self.peak_rss is not None else None
+            return {
+                'crawler': self.crawler,
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'seconds': time.perf_counter() - self.start,
+                'start_rss_bytes': self.start_rss,
+                'peak_rss_bytes': self.peak_rss,
+                'rss_increase_bytes': increase,
+                'process_peak_rss_bytes': process_peak_rss_bytes(),
+                'requests': {
+                    'count': self.requests,
+                    'cached': self.cached,
+                    'bytes': self.bytes,
+                    'latency_sum': self.latency_sum,
+                    'latency_buckets': histogram,
+                    'status_codes': dict(self.status_codes)
+                },
+                'counters': dict(self.counters),
+                'stages': stages
+            }
+
+    def prometheus(self, summary=None):
+        """Prometheus文本格式"""
+        summary = summary or self.summary()
+        label = f'crawler="{self.crawler}"'
+        requests = summary['requests']
+        lines = [
+            '# HELP crawler_request_duration_seconds HTTP request latency (cache hits excluded).',
+            '# TYPE crawler_request_duration_seconds histogram'
+        ]
+        for bound, count in requests['latency_buckets'].items():
+            lines.append(f'crawler_request_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+        lines += [
+            f'crawler_request_duration_seconds_sum{{{label}}} {requests["latency_sum"]:.6f}',
+            f'crawler_request_duration_seconds_count{{{label}}} {requests["count"]}',
+            '# HELP crawler_cached_responses Responses served from the local HTTP cache in the last run.',
+            '# TYPE crawler_cached_responses gauge',
+            f'crawler_cached_responses{{{label}}} {requests["cached"]}',
+            '# HELP crawler_response_bytes Response body bytes received in the last run.',
+            '# TYPE crawler_response_bytes gauge',
+            f'crawler_response_bytes{{{label}}} {requests["bytes"]}',
+            '# HELP crawler_responses Responses by HTTP status code in the last run.',
+            '# TYPE crawler_responses gauge'
+        ]
+        for status, count in sorted(requests['status_codes'].items()):
+            lines.append(f'crawler_responses{{{label},status="{status}"}} {count}')
+        lines += ['# HELP crawler_events Retries, errors and waits (seconds) counted in the last run.',
+                  '# TYPE crawler_events gauge']
+        for name, value in sorted(summary['counters'].items()):
+            lines.append(f'crawler_events{{{label},event="{name}"}} {value}')
+
+        stage_metrics = [
+            ('seconds', 'crawler_stage_seconds', 'Time spent in each stage (summed across threads).'),
+            ('rows', 'crawler_stage_rows', 'Rows handled by each stage.'),
+            ('rows_per_sec', 'crawler_stage_rows_per_second', 'Rows per second of stage time.'),
+            ('peak_rss_bytes', 'crawler_stage_peak_rss_bytes', 'Largest current RSS sampled at the end of the stage in the last run.')
+        ]
+        for key, metric, help_text in stage_metrics:
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} gauge']
+            for name, stage in summary['stages'].items():
+                if stage[key] is not None:
+                    lines.append(f'{metric}{{{label},stage="{name}"}} {stage[key]}')
+
+        lines += [
+            '# HELP crawler_run_seconds Wall time of the last run.',
+            '# TYPE crawler_run_seconds gauge',
+            f'crawler_run_seconds{{{label}}} {summary["seconds"]:.3f}',
+            '# HELP crawler_last_run_timestamp_seconds Unix time the last run finished.',
+            '# TYPE crawler_last_run_timestamp_seconds gauge',
+            f'crawler_last_run_timestamp_seconds{{{label}}} {time.time():.0f}'
+        ]
+        memory_metrics = [
+            ('peak_rss_bytes', 'crawler_peak_rss_bytes', 'Largest current RSS sampled during the last run.'),
+            ('rss_increase_bytes', 'crawler_rss_increase_bytes', 'Sampled peak RSS minus RSS at the start of the last run.'),
+            ('process_peak_rss_bytes', 'crawler_process_peak_rss_bytes',
+             'Process-lifetime peak RSS (ru_maxrss), includes earlier runs in the same process.')
+        ]
+        for key, metric, help_text in memory_metrics:
+            if summary[key] is not None:
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} gauge',
+                          f'{metric}{{{label}}} {summary[key]}']
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        """写出Prometheus textfile和JSON汇总，返回 (prom路径, json路径)"""
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        summary = self.summary()
+        prom_path = os.path.join(self.directory, f'{self.crawler}.prom')
+        json_path = os.path.join(self.directory, f"{self.crawler}_{self.started_at.strftime('%Y%m%d_%H%M%S')}.json")
+        # textfile collector 可能随时读取，先写临时文件再替换
+        tmp_path = prom_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus(summary))
+        os.replace(tmp_path, prom_path)
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return prom_path, json_path
+
+
+def start(crawler, directory=METRICS_DIR, profiler=None):
+    """开始一次运行的指标记录，之后 get(crawler) 返回该对象"""
+    metrics = RunMetrics(crawler, directory, profiler)
+    with _active_lock:
+        _active[crawler] = metrics
+    return metrics
+
+
+def get(crawler):
+    """当前运行的指标对象；没有进行中的运行时返回一个不登记的对象"""
+    with _active_lock:
+        return _active.get(crawler) or RunMetrics(crawler)
+
+
+def finish(metrics):
+    """结束记录并写出文件，返回 (prom路径, json路径)"""
+    with _active_lock:
+        if _active.get(metrics.crawler) is metrics:
+            del _active[metrics.crawler]
+    return metrics.write()
@@ -0,0 +1,143 @@
+"""分块写出的文件sink：每次 write() 一个DataFrame块，close() 时落盘
+
+    ExcelStreamSink   .xlsx    openpyxl只写模式，超过单表行数上限时自动分到多个工作表
+    CsvStreamSink     .csv     逐块追加，UTF-8 BOM（Excel直接打开不乱码）
+    ParquetSink       .parquet pyarrow逐块追加行组，保留列类型，需要安装pyarrow
+
+open_sink(文件名) 按扩展名选择sink。CSV和Parquet先写 <文件名>.part，close() 时再改名，
+运行中途失败不会留下看起来完整的文件。
+"""
+import os
+
+# xlsx单个工作表最多1048576行，留一行给表头
+EXCEL_MAX_ROWS = 1048575
+PARQUET_COMPRESSION = 'zstd'   # 'zstd' / 'snappy' / 'gzip' / None
+CSV_ENCODING = 'utf-8-sig'
+
+
+class ExcelStreamSink:
+    """openpyxl只写模式流式写xlsx，行数据随写随落临时文件，内存不随行数增长"""
+
+    def __init__(self, filename, sheet_name='Sheet1', max_rows=EXCEL_MAX_ROWS):
+        from openpyxl import Workbook
+        self.filename = filename
+        self.workbook = Workbook(write_only=True)
+        self.sheet_name = sheet_name
+        self.max_rows = max_rows
+        self.sheet = None
+        self.sheets = 0
+        self.sheet_rows = 0
+        self.columns = None
+        self.rows = 0
+
+    def _next_sheet(self):
+        self.sheets += 1
+        name = self.sheet_name if self.sheets == 1 else f'{self.sheet_name}_{self.sheets}'
+        self.sheet = self.workbook.create_sheet(name)
+        self.sheet.append(self.columns)
+        self.sheet_rows = 0
+
+    def write(self, df):
+        from bulk_writer import iter_rows
+        if self.columns is None:
+            self.columns = list(df.columns)
+            self._next_sheet()
+        for row in iter_rows(df, self.columns):
+            if self.sheet_rows >= self.max_rows:
+                self._next_sheet()
+            self.sheet.append(row)
+            self.sheet_rows += 1
+        self.rows += len(df)
+
+    def close(self):
+        # 没有写入任何数据时不生成空文件
+        if self.columns is not None:
+            self.workbook.save(self.filename)
+
+
+class CsvStreamSink:
+    """逐块追加写CSV，只在内存中保留当前块"""
+
+    def __init__(self, filename, encoding=CSV_ENCODING):
+        self.filename = filename
+        self.encoding = encoding
+        self.file = None
+        self.columns = None
+        self.rows = 0
+
+    def write(self, df):
+        if self.file is None:
+            self.columns = list(df.columns)
+            self.file = open(self.filename + '.part', 'w', encoding=self.encoding, newline='')
+        df[self.columns].to_csv(self.file, header=self.rows == 0, index=False,
+                                date_format='%Y-%m-%d %H:%M:%S')
+        self.rows += len(df)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            os.replace(self.filename + '.part', self.filename)
+
+
+class ParquetSink:
+    """逐块追加Parquet行组，列类型取自第一块
+
+    分类列写成字典编码的字符串列（各块的类别集合不同也能追加）；
+    第一块中整列为空的列按字符串处理。
+    """
+
+    def __init__(self, filename, compression=PARQUET_COMPRESSION):
+        # 未安装pyarrow时在创建sink时就报错，由调用方记录
+        import pyarrow
+        self.filename = filename
+        self.compression = compression
+        self.schema = None
+        self.writer = None
+        self.rows = 0
+
+    def _schema(self, df):
+        import pyarrow as pa
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+        for i, field in enumerate(schema):
+            if pa.types.is_dictionary(field.type):
+                schema = schema.set(i, field.with_type(pa.dictionary(pa.int32(), pa.string())))
+            elif pa.types.is_null(field.type):
+                schema = schema.set(i, field.with_type(pa.string()))
+        return schema
+
+    def write(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if self.writer is None:
+            self.schema = self._schema(df)
+            self.writer = pq.ParquetWriter(self.filename + '.part', self.schema, compression=self.compression)
+        table = pa.Table.from_pandas(df[self.schema.names], schema=self.schema, preserve_index=False)
+        self.writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            os.replace(self.filename + '.part', self.filename)
+
+
+SINKS = {
+    '.xlsx': ExcelStreamSink,
+    '.csv': CsvStreamSink,
+    '.parquet': ParquetSink
+}
+
+
+def open_sink(filename, **kwargs):
+    """按扩展名创建文件sink"""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in SINKS:
+        raise ValueError(f"不支持的导出格式: {filename}（支持 {', '.join(SINKS)}）")
+    return SINKS[ext](filename, **kwargs)
+
+
+def write_frame(df, filename, **kwargs):
+    """一次性写出整个DataFrame"""
+    sink = open_sink(filename, **kwargs)
+    sink.write(df)
+    sink.close()
@@ -0,0 +1,158 @@
+"""按阶段的性能剖析：--profile 模式下用 cProfile 和 tracemalloc 包住每个流水线阶段
+
+阶段划分与 run_metrics 一致（fetch / parse / normalize / excel / db），由 RunMetrics.stage()
+和 RunMetrics.profile() 调用。运行结束写到日志目录：
+    logs/<爬虫>_profile_<时间>.txt          各阶段耗时热点（按累计时间前N）和内存分配位置（前N）
+    logs/<爬虫>_profile_<时间>_<阶段>.prof  pstats 原始数据，可用 snakeviz / pstats 进一步查看
+
+cProfile 按线程剖析：每个线程在每个阶段有自己的 Profile，报告时合并。
+同一线程里嵌套进入阶段，或解释器不允许多个剖析器同时启用（Python 3.12+）时，
+该次调用照常执行，只计入"未剖析"次数。tracemalloc 的峰值是进程级的，并发阶段之间会互相影响。
+"""
+import cProfile
+import io
+import os
+import pstats
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE_DIR = 'logs'
+TOP_N = 25
+# 每个阶段只对前几次调用做内存快照对比（快照开销较大）
+SNAPSHOT_CALLS = 3
+TRACEMALLOC_FRAMES = 10
+
+
+class StageProfiler:
+    """一次运行的分阶段剖析器"""
+
+    def __init__(self, crawler, directory=PROFILE_DIR, top_n=TOP_N, snapshot_calls=SNAPSHOT_CALLS):
+        self.crawler = crawler
+        self.directory = directory
+        self.top_n = top_n
+        self.snapshot_calls = snapshot_calls
+        self.started_at = datetime.now()
+        self.lock = threading.Lock()
+        self.snapshot_lock = threading.Lock()
+        self.local = threading.local()
+        self.stages = {}
+        self.own_tracemalloc = not tracemalloc.is_tracing()
+        if self.own_tracemalloc:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+    def _stage(self, name):
+        if name not in self.stages:
+            self.stages[name] = {
+                'profiles': [],
+                'calls': 0,
+                'unprofiled': 0,
+                'peak_bytes': 0,
+                'snapshots': 0,
+                'allocations': {}
+            }
+        return self.stages[name]
+
+    def _thread_profile(self, name):
+        """当前线程在该阶段的Profile"""
+        profiles = getattr(self.local, 'profiles', None)
+        if profiles is None:
+            profiles = self.local.profiles = {}
+        if name not in profiles:
+            profiles[name] = cProfile.Profile()
+            with self.lock:
+                self._stage(name)['profiles'].append(profiles[name])
+        return profiles[name]
+
+    @contextmanager
+    def profile(self, name):
+        profile = self._thread_profile(name)
+        try:
+            if getattr(self.local, 'active', False):
+                raise ValueError('nested stage')
+            profile.enable()
+        except ValueError:
+            with self.lock:
+                self._stage(name)['unprofiled'] += 1
+            yield
+            return
+
+        self.local.active = True
+        with self.lock:
+            stage = self._stage(name)
+            stage['calls'] += 1
+            take_snapshot = stage['snapshots'] < self.snapshot_calls and self.snapshot_lock.acquire(blocking=False)
+            if take_snapshot:
+                stage['snapshots'] += 1
+        try:
+            before = tracemalloc.take_snapshot() if take_snapshot else None
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            try:
+                yield
+            finally:
+                profile.disable()
+                peak = tracemalloc.get_traced_memory()[1] - baseline
+                with self.lock:
+                    stage['peak_bytes'] = max(stage['peak_bytes'], peak)
+                if before is not None:
+                    self._add_allocations(stage, tracemalloc.take_snapshot().compare_to(before, 'lineno'))
+        finally:
+            self.local.active = False
+            if take_snapshot:
+                self.snapshot_lock.release()
+
+    def _add_allocations(self, stage, diffs):
+        """累计各代码行在阶段内新增的内存（字节）和对象数"""
+        with self.lock:
+            allocations = stage['allocations']
+            for diff in diffs:
+                if diff.size_diff <= 0:
+                    continue
+                frame = diff.traceback[0]
+                key = f'{frame.filename}:{frame.lineno}'
+                size, count = allocations.get(key, (0, 0))
+                allocations[key] = (size + diff.size_diff, count + diff.count_diff)
+
+    def _stats(self, stage, stream=None):
+        """合并各线程的Profile"""
+        profiles = [profile for profile in stage['profiles'] if profile.getstats()]
+        stats = pstats.Stats(profiles[0], stream=stream)
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def report(self):
+        """文本报告"""
+        out = io.StringIO()
+        out.write(f"{self.crawler} 分阶段性能剖析 {self.started_at.isoformat(timespec='seconds')}\n")
+        for name, stage in self.stages.items():
+            out.write(f"\n{'=' * 30} {name} {'=' * 30}\n")
+            out.write(f"剖析调用 {stage['calls']} 次，未剖析 {stage['unprofiled']} 次，"
+                      f"单次调用tracemalloc峰值 {stage['peak_bytes'] / 1024 / 1024:.1f} MB\n")
+            if stage['calls']:
+                out.write(f"\n-- 耗时热点（按累计时间前{self.top_n}）--\n")
+                stats = self._stats(stage, out)
+                stats.sort_stats('cumulative').print_stats(self.top_n)
+            if stage['allocations']:
+                out.write(f"\n-- 内存分配（前{stage['snapshots']}次调用内新增，前{self.top_n}行）--\n")
+                top = sorted(stage['allocations'].items(), key=lambda item: item[1][0], reverse=True)
+                for key, (size, count) in top[:self.top_n]:
+                    out.write(f"{size / 1024:>12.1f} KiB {count:>9} 个对象  {key}\n")
+        return out.getvalue()
+
+    def write(self):
+        """写出文本报告和各阶段的.prof文件，停止tracemalloc，返回文本报告路径"""
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        prefix = os.path.join(self.directory,
+                              f"{self.crawler}_profile_{self.started_at.strftime('%Y%m%d_%H%M%S')}")
+        for name, stage in self.stages.items():
+            if stage['calls']:
+                self._stats(stage).dump_stats(f'{prefix}_{name}.prof')
+        with open(f'{prefix}.txt', 'w', encoding='utf-8') as f:
+            f.write(self.report())
+        if self.own_tracemalloc:
+            tracemalloc.stop()
+        return f'{prefix}.txt'
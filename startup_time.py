@@ -0,0 +1,53 @@
+"""启动耗时测量：在全新的解释器中导入各爬虫模块，统计导入耗时和被提前加载的重依赖
+
+用法:
+    python startup_time.py
+    python startup_time.py fund_crawler QStop --repeat 10
+
+导入爬虫模块应当没有副作用，也不应加载 pandas、SQLAlchemy、openpyxl，
+这些依赖在抓取、写库、写Excel阶段才导入。
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+MODULES = ['QStop', 'QS_requests', 'fund_crawler', 'fund_crawler_scheduler']
+HEAVY_MODULES = ['pandas', 'sqlalchemy', 'openpyxl', 'numpy']
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module, repeat=5):
+    """在子进程中导入 module repeat 次，返回 (导入耗时中位数(秒), 被加载的重依赖)"""
+    samples = []
+    heavy = []
+    code = PROBE.format(module=module, heavy=HEAVY_MODULES)
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        samples.append(probe['seconds'])
+        heavy = probe['heavy']
+    return statistics.median(samples), heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description='测量爬虫模块的导入耗时')
+    parser.add_argument('modules', nargs='*', default=MODULES, help='要测量的模块')
+    parser.add_argument('--repeat', type=int, default=5, help='每个模块重复次数，取中位数')
+    args = parser.parse_args()
+
+    for module in args.modules:
+        seconds, heavy = measure(module, args.repeat)
+        print(f"{module}: 导入耗时 {seconds * 1000:.0f} ms，提前加载的重依赖: {', '.join(heavy) or '无'}")
+
+
+if __name__ == '__main__':
+    main()
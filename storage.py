@@ -0,0 +1,278 @@
+"""存储后端：同一份表定义和写入接口，按后端生成建表语句和upsert语句
+
+    MySQLBackend    多行 INSERT ... ON DUPLICATE KEY UPDATE，每块一个事务
+    SQLiteBackend   WAL模式，INSERT ... ON CONFLICT DO UPDATE 分批 executemany，每块一个事务
+
+爬虫的 DB_BACKEND 选择后端：'mysql'（默认）或 'sqlite'。SQLite不需要数据库服务，
+整条流水线可以在一台机器上跑通和做基准测试，也可以当作本地分析用的数据副本。
+分区、EXCHANGE PARTITION、LOAD DATA 等只有MySQL支持的功能，在SQLite后端上退化为普通upsert。
+
+表定义（Table/Column）不依赖SQLAlchemy，可以放在爬虫模块顶层；SQLAlchemy在创建引擎和写库时才导入。
+"""
+import os
+import time
+from datetime import date, datetime
+from itertools import islice
+
+BACKEND_NAMES = ['mysql', 'sqlite']
+BATCH_SIZE = 1000
+# SQLite写入等锁的最长时间（毫秒），后台写线程和读者并发时避免 database is locked
+SQLITE_BUSY_TIMEOUT = 30000
+
+# 通用列类型 -> (MySQL, SQLite)
+TYPES = {
+    'int': ('INT', 'INTEGER'),
+    'uint': ('INT UNSIGNED', 'INTEGER'),
+    'bool': ('TINYINT(1)', 'INTEGER'),
+    'decimal': ('DECIMAL(10, 2)', 'REAL'),
+    'date': ('DATE', 'TEXT'),
+    'datetime': ('DATETIME', 'TEXT'),
+    'text': ('TEXT', 'TEXT')
+}
+
+
+class Column:
+    """列定义：type 为 TYPES 中的通用类型，或 'varchar(n)'"""
+
+    def __init__(self, name, type, nullable=True, default=None, comment=None, auto_increment=False):
+        self.name = name
+        self.type = type
+        self.nullable = nullable
+        self.default = default
+        self.comment = comment
+        self.auto_increment = auto_increment
+
+
+class Table:
+    """表定义：主键、唯一键 {名称: 列}、二级索引 {名称: 列}；mysql_options 追加在MySQL建表语句末尾（如分区）"""
+
+    def __init__(self, name, columns, primary_key, unique=None, indexes=None, comment=None, mysql_options=''):
+        self.name = name
+        self.columns = columns
+        self.primary_key = list(primary_key)
+        self.unique = unique or {}
+        self.indexes = indexes or {}
+        self.comment = comment
+        self.mysql_options = mysql_options
+
+
+class Backend:
+    """存储后端基类，包装一个SQLAlchemy引擎"""
+
+    name = None
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def quote(self, name):
+        return f'`{name}`'
+
+    def column_list(self, columns):
+        return ', '.join(self.quote(col) for col in columns)
+
+    def create_table_sql(self, table):
+        """建表语句列表（SQLite的索引要单独建）"""
+        raise NotImplementedError
+
+    def create_table(self, table, conn=None):
+        from sqlalchemy import text
+        if conn is None:
+            with self.engine.begin() as conn:
+                return self.create_table(table, conn)
+        for sql in self.create_table_sql(table):
+            conn.execute(text(sql))
+
+    def insert_ignore_sql(self, table, columns):
+        """单行插入，唯一键冲突时忽略；参数名为列名"""
+        raise NotImplementedError
+
+    def upsert(self, table, df, columns=None, update_columns=(), batch_size=BATCH_SIZE):
+        """分块写入DataFrame，任一唯一键冲突时更新update_columns，每块一个事务，
+        返回 {'rows', 'seconds', 'rows_per_sec'}"""
+        raise NotImplementedError
+
+    def dispose(self):
+        self.engine.dispose()
+
+
+def _stats(total, start):
+    seconds = time.perf_counter() - start
+    return {
+        'rows': total,
+        'seconds': seconds,
+        'rows_per_sec': total / seconds if seconds > 0 else 0.0
+    }
+
+
+class MySQLBackend(Backend):
+
+    name = 'mysql'
+
+    def column_sql(self, column):
+        sql_type = TYPES[column.type][0] if column.type in TYPES else column.type.upper()
+        sql = f'{self.quote(column.name)} {sql_type}'
+        if not column.nullable:
+            sql += ' NOT NULL'
+        if column.auto_increment:
+            sql += ' AUTO_INCREMENT'
+        if column.default is not None:
+            sql += f' DEFAULT {column.default}'
+        if column.comment:
+            sql += f" COMMENT '{column.comment}'"
+        return sql
+
+    def create_table_sql(self, table):
+        parts = [self.column_sql(column) for column in table.columns]
+        parts.append(f'PRIMARY KEY ({self.column_list(table.primary_key)})')
+        parts += [f'UNIQUE KEY {name} ({self.column_list(columns)})' for name, columns in table.unique.items()]
+        parts += [f'INDEX {name} ({self.column_list(columns)})' for name, columns in table.indexes.items()]
+        options = 'ENGINE = InnoDB DEFAULT CHARSET = utf8mb4'
+        if table.comment:
+            options += f" COMMENT = '{table.comment}'"
+        body = ',\n    '.join(parts)
+        return [f"CREATE TABLE IF NOT EXISTS {table.name} (\n    {body}\n) {options}\n{table.mysql_options}"]
+
+    def insert_ignore_sql(self, table, columns):
+        return (f"INSERT IGNORE INTO {table} ({self.column_list(columns)}) "
+                f"VALUES ({', '.join(':' + col for col in columns)})")
+
+    def upsert(self, table, df, columns=None, update_columns=(), batch_size=BATCH_SIZE):
+        from sqlalchemy import text
+        from bulk_writer import build_upsert_sql, iter_rows
+        columns = list(columns or df.columns)
+        start = time.perf_counter()
+        statements = {}
+        total = 0
+
+        rows = iter_rows(df, columns)
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                break
+            if len(chunk) not in statements:
+                statements[len(chunk)] = text(build_upsert_sql(table, columns, update_columns, len(chunk)))
+
+            params = {}
+            for i, row in enumerate(chunk):
+                for col, value in zip(columns, row):
+                    params[f'{col}_{i}'] = value
+
+            with self.engine.begin() as conn:
+                conn.execute(statements[len(chunk)], params)
+            total += len(chunk)
+        return _stats(total, start)
+
+
+class SQLiteBackend(Backend):
+
+    name = 'sqlite'
+
+    def column_sql(self, column, inline_primary_key=False):
+        sql_type = TYPES[column.type][1] if column.type in TYPES else 'TEXT'
+        sql = f'{self.quote(column.name)} {sql_type}'
+        if inline_primary_key:
+            # INTEGER PRIMARY KEY 即rowid，AUTOINCREMENT保证删除后id不复用（与MySQL一致）
+            return sql + ' PRIMARY KEY AUTOINCREMENT'
+        if not column.nullable:
+            sql += ' NOT NULL'
+        if column.default is not None:
+            sql += f' DEFAULT {column.default}'
+        return sql
+
+    def create_table_sql(self, table):
+        auto = [column.name for column in table.columns if column.auto_increment]
+        inline = auto == table.primary_key
+        parts = [self.column_sql(column, inline and column.auto_increment) for column in table.columns]
+        if not inline:
+            parts.append(f'PRIMARY KEY ({self.column_list(table.primary_key)})')
+        parts += [f'CONSTRAINT {name} UNIQUE ({self.column_list(columns)})' for name, columns in table.unique.items()]
+        body = ',\n    '.join(parts)
+        statements = [f"CREATE TABLE IF NOT EXISTS {table.name} (\n    {body}\n)"]
+        # SQLite的索引名在整个库内唯一，加上表名前缀
+        statements += [f"CREATE INDEX IF NOT EXISTS {table.name}_{name} ON {table.name} ({self.column_list(columns)})"
+                       for name, columns in table.indexes.items()]
+        return statements
+
+    def insert_ignore_sql(self, table, columns):
+        return (f"INSERT OR IGNORE INTO {table} ({self.column_list(columns)}) "
+                f"VALUES ({', '.join(':' + col for col in columns)})")
+
+    def upsert_sql(self, table, columns, update_columns):
+        """单行upsert语句，不指定冲突目标：任一主键/唯一键冲突都走更新（与ON DUPLICATE KEY UPDATE一致）"""
+        values_sql = ', '.join(f':{col}' for col in columns)
+        sql = f"INSERT INTO {table} ({self.column_list(columns)}) VALUES ({values_sql})"
+        if not update_columns:
+            return sql.replace('INSERT INTO', 'INSERT OR IGNORE INTO', 1)
+        update_sql = ', '.join(f'{self.quote(col)} = excluded.{self.quote(col)}' for col in update_columns)
+        return f"{sql} ON CONFLICT DO UPDATE SET {update_sql}"
+
+    def upsert(self, table, df, columns=None, update_columns=(), batch_size=BATCH_SIZE):
+        from sqlalchemy import text
+        from bulk_writer import iter_rows
+        columns = list(columns or df.columns)
+        statement = text(self.upsert_sql(table, columns, update_columns))
+        start = time.perf_counter()
+        total = 0
+
+        rows = iter_rows(df, columns)
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                break
+            # 单行语句 + executemany：SQLite解析一次、逐行绑定，没有多行语句的参数个数上限
+            params = [{col: _sqlite_value(value) for col, value in zip(columns, row)} for row in chunk]
+            with self.engine.begin() as conn:
+                conn.execute(statement, params)
+            total += len(chunk)
+        return _stats(total, start)
+
+
+def _sqlite_value(value):
+    """日期写成ISO字符串（与MySQL DATE/DATETIME的文本形式一致，可直接比较和排序）"""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+BACKENDS = {
+    'mysql': MySQLBackend,
+    'sqlite': SQLiteBackend
+}
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL：写入不阻塞读者；synchronous=NORMAL 在WAL下只在检查点时fsync
+    cursor.execute('PRAGMA journal_mode = WAL')
+    cursor.execute('PRAGMA synchronous = NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT}')
+    cursor.close()
+
+
+def create_engine(backend, config=None, path=None, **kwargs):
+    """创建引擎：mysql 用 config（DB_CONFIG），sqlite 用数据库文件路径"""
+    import sqlalchemy
+    if backend == 'sqlite':
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        engine = sqlalchemy.create_engine(f'sqlite:///{path}', **kwargs)
+        sqlalchemy.event.listen(engine, 'connect', _sqlite_pragmas)
+        return engine
+    if backend == 'mysql':
+        return sqlalchemy.create_engine(
+            f"mysql+pymysql://{config['user']}:{config['password']}@{config['host']}:"
+            f"{config['port']}/{config['database']}?charset={config.get('charset', 'utf8mb4')}",
+            **kwargs
+        )
+    raise ValueError(f"不支持的数据库后端: {backend}（支持 {', '.join(BACKEND_NAMES)}）")
+
+
+def backend_for(engine):
+    """引擎对应的存储后端"""
+    name = engine.dialect.name
+    if name not in BACKENDS:
+        raise ValueError(f"不支持的数据库后端: {name}")
+    return BACKENDS[name](engine)
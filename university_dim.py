@@ -0,0 +1,191 @@
+"""大学维度表：给每所大学分配稳定的整数id，排名事实表只存id
+
+解析顺序：先按QS的 path 精确匹配，再按规范化后的名称匹配（大小写、重音、标点不影响），
+都找不到才登记新大学。path 是权威键：带path的行只会匹配到同名且还没有path的大学，
+同名但path不同的是另一所大学（规范化名称不唯一）。维度表在解析器创建时一次性读入内存，
+爬取过程中的解析都走内存缓存，只有新大学才访问数据库。
+"""
+import re
+import threading
+import unicodedata
+
+import pandas as pd
+from sqlalchemy import text, bindparam
+
+from storage import Column, Table, backend_for
+
+# 维度表中保存的描述字段（首次登记时写入）
+ATTRIBUTE_COLUMNS = ['location', 'country', 'city', 'region', 'logo_url']
+
+UNIVERSITY_DIM = Table(
+    'university_dim',
+    [
+        Column('id', 'uint', nullable=False, auto_increment=True),
+        Column('university_name', 'varchar(255)', nullable=False),
+        Column('normalized_name', 'varchar(255)', nullable=False),
+        Column('path', 'varchar(255)'),
+        Column('location', 'varchar(255)'),
+        Column('country', 'varchar(100)'),
+        Column('city', 'varchar(100)'),
+        Column('region', 'varchar(100)'),
+        Column('logo_url', 'text'),
+        Column('create_time', 'datetime', nullable=False, default='CURRENT_TIMESTAMP')
+    ],
+    primary_key=['id'],
+    unique={'uk_path': ['path']},
+    indexes={'idx_normalized_name': ['normalized_name']},
+    comment='大学维度表'
+)
+
+
+def create_university_dim_table(conn):
+    """建维度表；旧版本的表上 normalized_name 是唯一键，改为普通索引"""
+    backend = backend_for(conn.engine)
+    if backend.name == 'mysql':
+        backend.create_table(UNIVERSITY_DIM, conn)
+        legacy = conn.execute(text("""
+            SELECT 1 FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'university_dim' AND INDEX_NAME = 'uk_normalized_name'
+            LIMIT 1
+        """)).first()
+        if legacy:
+            conn.execute(text("ALTER TABLE university_dim DROP INDEX uk_normalized_name, "
+                              "ADD INDEX idx_normalized_name (normalized_name)"))
+        return
+    table_sql = conn.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'university_dim'"
+    )).scalar()
+    if table_sql and 'uk_normalized_name' in table_sql:
+        # SQLite不能删除表上的约束，按新结构重建后复制数据（保留id）
+        conn.execute(text("ALTER TABLE university_dim RENAME TO university_dim_old"))
+        backend.create_table(UNIVERSITY_DIM, conn)
+        columns = backend.column_list(column.name for column in UNIVERSITY_DIM.columns)
+        conn.execute(text(f"INSERT INTO university_dim ({columns}) SELECT {columns} FROM university_dim_old"))
+        conn.execute(text("DROP TABLE university_dim_old"))
+        return
+    backend.create_table(UNIVERSITY_DIM, conn)
+
+
+def normalize_name(name):
+    """'The University of Tōkyō (UTokyo)' -> 'university of tokyo utokyo'
+
+    括号中的内容保留：'Soochow University (Taiwan)' 和 'Soochow University' 是两所大学。
+    """
+    value = unicodedata.normalize('NFKD', str(name))
+    value = ''.join(c for c in value if not unicodedata.combining(c)).lower()
+    value = re.sub(r'\W+', ' ', value.replace('&', ' and ')).strip()
+    value = re.sub(r'^the ', '', value)
+    return ' '.join(value.split())
+
+
+def normalize_path(path):
+    if path is None or pd.isna(path):
+        return None
+    value = str(path).strip().lower().rstrip('/')
+    return value or None
+
+
+def check_distinct_paths(ids, paths):
+    """path不同的行不能解析到同一个id，否则它们的事实行会在upsert时互相覆盖"""
+    seen = {}
+    for university_id, path in zip(ids, paths):
+        if path and seen.setdefault(university_id, path) != path:
+            raise ValueError(f"path不同的大学解析到了同一个id {university_id}: {seen[university_id]} / {path}")
+
+
+class UniversityResolver:
+    """大学名称/path -> university_dim.id 的解析器，线程安全（后台写入线程会调用）"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.lock = threading.Lock()
+        self.by_path = {}
+        self.by_name = {}   # 规范化名称 -> [id, ...]（按id升序，同名不同path的大学有多个）
+        self.paths = {}     # id -> path
+        with engine.begin() as conn:
+            create_university_dim_table(conn)
+            rows = conn.execute(text("SELECT id, university_name, normalized_name, path FROM university_dim ORDER BY id"))
+            stale = []
+            for university_id, name, stored, path in rows:
+                normalized = normalize_name(name)
+                if normalized != stored:
+                    stale.append({'id': university_id, 'normalized_name': normalized})
+                self._remember(university_id, normalized, path)
+            if stale:
+                # 规范化规则变化后（如保留括号内容）更新存储的规范化名称，按名称查询的轨迹才能匹配
+                conn.execute(text("UPDATE university_dim SET normalized_name = :normalized_name WHERE id = :id"), stale)
+
+    def _remember(self, university_id, normalized, path):
+        ids = self.by_name.setdefault(normalized, [])
+        if university_id not in ids:
+            ids.append(university_id)
+        if path:
+            self.by_path[path] = university_id
+            self.paths[university_id] = path
+
+    def lookup(self, normalized, path):
+        """只查内存，找不到返回None；带path时不会匹配到path不同的同名大学"""
+        if path and path in self.by_path:
+            return self.by_path[path]
+        for university_id in self.by_name.get(normalized, ()):
+            if not path or university_id not in self.paths:
+                return university_id
+        return None
+
+    def resolve(self, df):
+        """按 university_name（及可选的 path 和描述字段）解析id，返回与df行对齐的Int64 Series"""
+        keys = pd.DataFrame({
+            'university_name': df['university_name'].astype(str).to_numpy(),
+            'path': df['path'].map(normalize_path).to_numpy() if 'path' in df else None
+        })
+        for col in ATTRIBUTE_COLUMNS:
+            keys[col] = df[col].to_numpy() if col in df else None
+        names = keys['university_name'].drop_duplicates()
+        keys['normalized'] = keys['university_name'].map(dict(zip(names, names.map(normalize_name))))
+        unique = keys.drop_duplicates(['normalized', 'path'])
+
+        with self.lock:
+            missing = []
+            learned = []
+            for row in unique.itertuples(index=False):
+                university_id = self.lookup(row.normalized, row.path)
+                if university_id is None:
+                    missing.append(row)
+                elif row.path and row.path not in self.by_path:
+                    # 按名称匹配到还没有path的大学，补上path
+                    learned.append({'id': university_id, 'path': row.path})
+                    self._remember(university_id, row.normalized, row.path)
+            if missing or learned:
+                self._register(missing, learned)
+            ids = [self.lookup(normalized, path) for normalized, path in zip(keys['normalized'], keys['path'])]
+        check_distinct_paths(ids, keys['path'])
+        return pd.Series(ids, index=df.index, dtype='Int64')
+
+    def _register(self, missing, learned):
+        """登记新大学，并给之前按名称登记、还没有path的大学补上path"""
+        columns = ['university_name', 'normalized_name', 'path', *ATTRIBUTE_COLUMNS]
+        insert_sql = backend_for(self.engine).insert_ignore_sql('university_dim', columns)
+        rows = [{
+            'university_name': row.university_name,
+            'normalized_name': row.normalized,
+            'path': row.path,
+            **{col: None if pd.isna(getattr(row, col)) else getattr(row, col) for col in ATTRIBUTE_COLUMNS}
+        } for row in missing]
+        with self.engine.begin() as conn:
+            if learned:
+                conn.execute(text("UPDATE university_dim SET path = :path WHERE id = :id AND path IS NULL"), learned)
+            if rows:
+                conn.execute(text(insert_sql), rows)
+                result = conn.execute(
+                    text("SELECT id, university_name, path FROM university_dim "
+                         "WHERE path IN :paths OR (path IS NULL AND normalized_name IN :names) ORDER BY id")
+                    .bindparams(bindparam('names', expanding=True), bindparam('paths', expanding=True)),
+                    {'names': [row['normalized_name'] for row in rows if not row['path']] or [''],
+                     'paths': [row['path'] for row in rows if row['path']] or ['']}
+                )
+                for university_id, name, path in result:
+                    self._remember(university_id, normalize_name(name), path)
+
+    def assign_ids(self, df):
+        """返回带 university_id 列的副本"""
+        return df.assign(university_id=self.resolve(df).to_numpy())